@@ -1,5 +1,30 @@
 """Configuration library."""
 
+import importlib
+
+# Submodules load on first attribute access (PEP 562), so importing superconfig stays cheap.
+_submodules = {
+    "aws",
+    "builders",
+    "config",
+    "converters",
+    "exceptions",
+    "formats",
+    "gtrs",
+    "helpers",
+    "let",
+    "loaders",
+    "misc",
+    "statics",
+}
+
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module("superconfig." + name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
 # DONE(jmyounker): Rename JsonLayer to ObjLayer
 # DONE(jmyounker): Rename InnerJsonLayer to InnerObjLayer
 # DONE(jmyounker): Add InnerJsonLayer
@@ -1,6 +1,8 @@
-import contextlib
-
-import boto3
+import concurrent.futures
+import functools
+import math
+import threading
+import time
 
 from superconfig import config
 from superconfig import exceptions
@@ -29,20 +31,23 @@ class AwsParameterStoreFetcher(loaders.AbstractFetcher):
     That means I don't even need to use fetchers since the fields map
     directly to the cache layer.
 
+    With prefetch set, the nodes keep serving the values listed with the tree
+    and only see updates when the tree itself is refreshed, so lookups never
+    call GetParameter.
+
     """
-    def __init__(self, root=None, client=None, binary_decoder=None):
+    def __init__(self, root=None, client=None, binary_decoder=None, node_ttl_s=0, prefetch=False):
         self._client = client
-        self._root = None if root is None else helpers.ExpandableString(root)
-        self._binary_decoder = binary_decoder or (lambda x: x)
+        self._root = None if root is None else helpers.expandable(root)
+        self._binary_decoder = binary_decoder or _identity
+        self._node_ttl_s = math.inf if prefetch else node_ttl_s
 
-    @contextlib.contextmanager
     def load(self, now, key, rest, context, lower_layer):
-        yield self.parameter_tree(self.get_client(), self.name(key, context, lower_layer))
+        return _Passthrough(self.parameter_tree(self.client, self.name(key, context, lower_layer)))
 
-    def get_client(self):
-        if self._client:
-            return self._client
-        return boto3.client("ssm")
+    @functools.cached_property
+    def client(self):
+        return self._client or default_client("ssm")
 
     def name(self, key, context, lower_layer):
         if self._root is None:
@@ -50,74 +55,127 @@ class AwsParameterStoreFetcher(loaders.AbstractFetcher):
         return self._root.expand(context, lower_layer)
 
     def parameter_tree(self, client, path):
-        tree = {}
-        for k, p in self.describe_parameters_with_keys(client, path):
-            tree[k] = ParameterNode(client, p, self._binary_decoder)
-        return tree
+        return {
+            k: ParameterNode(client, p, self._binary_decoder, p, ttl_s=self._node_ttl_s)
+            for k, p in self.parameters_with_keys(client, path)
+        }
 
-    def describe_parameters_with_keys(self, client, path):
-        for p in self.describe_parameters(client, path):
-            key = p["Name"][len(path):].strip("/").replace("/", ".")
-            yield (key, p)
+    def parameters_with_keys(self, client, path):
+        # The path only matches names under it, so each key is the name with
+        # the path and its trailing separator sliced off.
+        prefix_len = len(path.rstrip("/")) + 1
+        return [(p["Name"][prefix_len:].replace("/", "."), p) for p in self.parameters_by_path(client, path)]
 
     @staticmethod
-    def describe_parameters(client, path):
-        paginator = client.get_paginator('describe_parameters')
-        pager = paginator.paginate(
-            ParameterFilters=[
-                dict(Key="Path", Option="Recursive", Values=[path])
-            ]
-        )
-        for page in pager:
-            for p in page['Parameters']:
-                yield p
+    def parameters_by_path(client, path):
+        """Lists every parameter under path along with its value, ten per call."""
+        paginator = client.get_paginator('get_parameters_by_path')
+        return paginator.paginate(
+            Path=path,
+            Recursive=True,
+            WithDecryption=True,
+            PaginationConfig=dict(PageSize=10),
+        ).build_full_result().get('Parameters', [])
 
 
 class ParameterNode:
-    def __init__(self, client, parameter, binary_decoder):
+    """A single parameter in the tree.
+
+    The value fetched along with the tree is served on the first read. Later
+    reads go back to parameter store so that caches above the node see updates
+    without waiting for the whole tree to refresh.
+
+    If a later read fails for any reason other than the parameter having been
+    deleted, such as throttling that outlasted the client's retries, the last
+    value read is served instead.
+
+    With ttl_s set, a value is reused for that many seconds after it is read
+    before the node asks parameter store again.
+
+    """
+    def __init__(self, client, parameter, binary_decoder, prefetched=None, ttl_s=0):
         self.client = client
         self.parameter = parameter
         self.binary_decoder = binary_decoder
+        self.prefetched = prefetched
+        self.ttl_s = ttl_s
+        self.fresh_until = 0
 
     def read(self, key, rest, context, lower_layer):
-        # noinspection PyBroadException
-        try:
-            resp = self.client.get_parameter(Name=self.parameter["Name"], WithDecryption=True)
-            p = resp["Parameter"]
-        except Exception:
-            return config.Response.not_found_next
-        if p["Type"] == "String":
-            return config.Response.found_next(p["Value"])
-        elif p["Type"] == "StringList":
-            return config.Response.found_next(p["Value"].split(","))
-        elif p["Type"] == "SecureString":
-            return config.Response.found_next(self.binary_decoder(p["Value"]))
+        now = time.monotonic()
+        p, self.prefetched = self.prefetched, None
+        if p is not None:
+            self.fresh_until = now + self.ttl_s
+        elif now < self.fresh_until:
+            p = self.parameter
         else:
+            client_error, botocore_error = _botocore_errors()
+            # noinspection PyBroadException
+            try:
+                resp = self.client.get_parameter(Name=self.parameter["Name"], WithDecryption=True)
+                p = self.parameter = resp["Parameter"]
+                self.fresh_until = now + self.ttl_s
+            except client_error as e:
+                if e.response.get("Error", {}).get("Code") == "ParameterNotFound":
+                    return config.Response.not_found_next
+                p = self.parameter
+            except botocore_error:
+                p = self.parameter
+            except Exception:
+                return config.Response.not_found_next
+            if "Value" not in p:
+                return config.Response.not_found_next
+        convert = self.value_by_type.get(p["Type"])
+        if convert is None:
             return config.Response.not_found_next
+        return config.Response.found_next(convert(self, p["Value"]))
+
+    def _string_value(self, value):
+        return value
+
+    def _string_list_value(self, value):
+        return value.split(",")
+
+    def _secure_string_value(self, value):
+        if self.binary_decoder is _identity:
+            return value
+        return self.binary_decoder(value)
+
+    value_by_type = {
+        "String": _string_value,
+        "StringList": _string_list_value,
+        "SecureString": _secure_string_value,
+    }
 
 
 class SecretsManagerFetcher(loaders.AbstractFetcher):
-    def __init__(self, name=None, client=None, stage=None, binary_decoder=None):
+    """Pulls secrets from AWS secrets manager.
+
+    A secret_cache, such as aws_secretsmanager_caching.SecretCache, can be
+    supplied. Single secret lookups are then served from it rather than
+    calling GetSecretValue on every load.
+
+    """
+    def __init__(self, name=None, client=None, stage=None, binary_decoder=None, secret_cache=None):
         self._client = client
         self._name = name
         self._stage = stage
-        self._binary_decoder = binary_decoder or (lambda x: x)
+        self._binary_decoder = binary_decoder or _identity
+        self._secret_cache = secret_cache
 
-    @contextlib.contextmanager
     def load(self, now, key, rest, context, lower_layer):
         try:
-            yield self.value_from_secret(
+            return _Passthrough(self.value_from_secret(
                 self.get_secret(
-                    self.get_client(),
+                    self.client,
                     self.name(key, context, lower_layer),
-                    self.stage(context, lower_layer)))
+                    self.stage(context, lower_layer))))
         except Exception:
             raise exceptions.FetchFailure()
 
-    def get_client(self):
-        if self._client:
-            return self._client
-        return boto3.client("secretsmanager")
+    @functools.cached_property
+    def client(self):
+        return self._client or default_client("secretsmanager")
 
     def name(self, key, context, lower_layer):
         if self._name is None:
@@ -129,8 +187,9 @@ class SecretsManagerFetcher(loaders.AbstractFetcher):
             return None
         return self._stage(context, lower_layer)
 
-    @staticmethod
-    def get_secret(client, name, stage):
+    def get_secret(self, client, name, stage):
+        if self._secret_cache is not None:
+            return self.get_cached_secret(name, stage)
         kwargs = {'SecretId': name}
         if stage is not None:
             kwargs['VersionStage'] = stage
@@ -139,16 +198,151 @@ class SecretsManagerFetcher(loaders.AbstractFetcher):
         except Exception:
             raise exceptions.FetchFailure()
 
+    def get_cached_secret(self, name, stage):
+        version_stage = 'AWSCURRENT' if stage is None else stage
+        try:
+            value = self._secret_cache.get_secret_string(name, version_stage)
+            if value is not None:
+                return {'SecretString': value}
+            return {'SecretBinary': self._secret_cache.get_secret_binary(name, version_stage)}
+        except Exception:
+            raise exceptions.FetchFailure()
+
+    def fetch_many(self, names, stage=None):
+        """Fetches several secrets at once, returning a dict of name to value.
+
+        Secrets are requested in batches of up to 20. Any secret the batch call
+        reports an error for is retried individually, and secrets that still
+        cannot be fetched are left out of the result. Batch calls cannot select
+        a version stage, so staged lookups are always made one at a time.
+        Individual lookups run on up to eight threads so their round trips
+        overlap.
+
+        """
+        client = self.client
+        values = {}
+        failed = []
+        if stage is None:
+            for chunk in chunked(names, 20):
+                try:
+                    resp = client.batch_get_secret_value(SecretIdList=chunk)
+                except Exception:
+                    failed.extend(chunk)
+                    continue
+                by_id = {}
+                for secret in resp.get('SecretValues', []):
+                    for secret_id in (secret.get('Name'), secret.get('ARN')):
+                        if secret_id is not None:
+                            by_id[secret_id] = secret
+                for name in chunk:
+                    if name in by_id:
+                        try:
+                            values[name] = self.value_from_secret(by_id[name])
+                        except exceptions.FetchFailure:
+                            pass
+                    else:
+                        failed.append(name)
+        else:
+            failed = list(names)
+        if failed:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, len(failed))) as pool:
+                futures = {
+                    pool.submit(self.get_secret, client, name, stage): name
+                    for name in failed
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        values[futures[future]] = self.value_from_secret(future.result())
+                    except exceptions.FetchFailure:
+                        pass
+        return values
+
     def value_from_secret(self, secret):
         if 'SecretString' in secret:
-            return bytes(secret['SecretString'].encode('utf8'))
+            return secret['SecretString'].encode('utf8')
         elif 'SecretBinary' in secret:
+            if self._binary_decoder is _identity:
+                return secret['SecretBinary']
             return self._binary_decoder(secret['SecretBinary'])
         else:
             raise exceptions.FetchFailure("cannot extract value: neither SecretString nor SecretBinary found")
 
 
+def _identity(x):
+    """The default binary_decoder. Decoding checks for it and skips the call."""
+    return x
+
+
+class _Passthrough:
+    """Hands value to a with block. Fetchers with nothing to clean up return
+    this rather than paying for a generator based context manager."""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __enter__(self):
+        return self.value
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+@functools.lru_cache(maxsize=None)
+def _botocore_errors():
+    """Returns botocore's ClientError and BotoCoreError, importing botocore on first use."""
+    import botocore.exceptions
+    return botocore.exceptions.ClientError, botocore.exceptions.BotoCoreError
+
+
+_default_clients = {}
+_default_clients_lock = threading.Lock()
+
+
+def default_client(service_name):
+    """The client fetchers share when none is injected.
+
+    Clients are thread safe and expensive to build, so one client per service
+    is shared by every fetcher in the process, which keeps its connection pool
+    warm across loads. They use botocore's adaptive retry mode so bursts of
+    refreshes back off when AWS throttles them.
+
+    Clients come from boto3's default session, so profiles and regions set up
+    with boto3.setup_default_session() apply. Setting up a new default session
+    builds new clients from then on, though fetchers keep the client they
+    already hold.
+
+    boto3 is imported here rather than with the module, so programs that
+    build configs without touching AWS don't pay for loading it.
+
+    """
+    import boto3
+    import botocore.config
+    with _default_clients_lock:
+        if boto3.DEFAULT_SESSION is None:
+            boto3.setup_default_session()
+        session = boto3.DEFAULT_SESSION
+        cached = _default_clients.get(service_name)
+        if cached is None or cached[0] is not session:
+            client_config = botocore.config.Config(retries={"mode": "adaptive", "max_attempts": 10})
+            cached = _default_clients[service_name] = (session, session.client(service_name, config=client_config))
+        return cached[1]
+
+
+def chunked(xs, n):
+    xs = list(xs)
+    for i in range(0, len(xs), n):
+        yield xs[i:i + n]
+
+
 def config_switch(enable_key, default=False):
+    """Switches on the value at enable_key, falling back to default.
+
+    A bool enable_key is the switch's value itself, so no lookup is needed.
+    """
+    if isinstance(enable_key, bool):
+        return config_switch_static(enable_key)
+
     def _config_switch(key, rest, context, lower_layer, enable_key=enable_key, default=default):
         resp = lower_layer.get_item(enable_key, context, config.NullLayer)
         if resp.is_found:
@@ -156,3 +350,11 @@ def config_switch(enable_key, default=False):
         else:
             return default
     return _config_switch
+
+
+def config_switch_static(value):
+    value = bool(value)
+
+    def _config_switch_static(key, rest, context, lower_layer, value=value):
+        return value
+    return _config_switch_static
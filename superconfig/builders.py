@@ -1,4 +1,5 @@
 """The high level interface for building config trees."""
+import hashlib
 from typing import Tuple, Any
 
 from superconfig import aws
@@ -29,6 +30,7 @@ def aws_parameter_store_layer(
         ttl_s=gtrs.constant(30),
         negative_ttl_s=gtrs.constant(10),
         is_enabled=None,
+        prefetch=False,
 ):
     return gtrs.GetterAsLayer(
         aws_parameter_store_getter(
@@ -38,6 +40,7 @@ def aws_parameter_store_layer(
             ttl_s=ttl_s,
             negative_ttl_s=negative_ttl_s,
             is_enabled=None if is_enabled is None else let.compile(is_enabled),
+            prefetch=prefetch,
         )
     )
 
@@ -50,13 +53,15 @@ def aws_parameter_store_getter(
     ttl_s=gtrs.constant(30),
     negative_ttl_s=gtrs.constant(10),
     is_enabled=None,
+    prefetch=False,
 ):
     return gtrs.CacheGetter(
         loaders.AutoRefreshGetter(
             layer_constructor=gtrs.IndexGetterLayer,
             fetcher=aws.AwsParameterStoreFetcher(
                 root=parameter_store_base_path,
-                binary_decoder=binary_decoder
+                binary_decoder=binary_decoder,
+                prefetch=prefetch,
             ),
             refresh_interval_s=refresh_interval_s,
             retry_interval_s=retry_interval_s,
@@ -139,8 +144,7 @@ def aws_parameter_store_getter(
 # )
 #
 
-class NoDefault:
-    pass
+_missing = object()
 
 
 def value(
@@ -148,11 +152,11 @@ def value(
     envar=None,
     envars=None,
     env_transform=None,
-    default=NoDefault,
+    default=_missing,
     stop=False,
     expand_result=False,
 ):
-    if stop and default != NoDefault:
+    if stop and default is not _missing:
         raise ValueError("default and stop are mutually incompatible")
     if envars is None:
         envars = []
@@ -164,12 +168,12 @@ def value(
     if env_transform:
         getters = [gtrs.Transform(env_transform, gtrs.GetterStack(getters))]
     getters.append(gtrs.BaseKeyReference())
-    if default != NoDefault:
+    if default is not _missing:
         getters.append(gtrs.Constant(default))
     elif stop:
-        getters.append(gtrs.Stop)
+        getters.append(gtrs.stop)
     else:
-        getters.append(gtrs.NotFound)
+        getters.append(gtrs.not_found)
     v = gtrs.GetterStack(getters)
     if expand_result:
         v = gtrs.ExpansionGetter(v)
@@ -184,6 +188,8 @@ def file_layer(
     is_enabled=None,
     refresh_interval_s=30,  # Can be: int "{}" GETTER Key()
     retry_interval_s=10,
+    max_refresh_interval_s=None,
+    background_refresh=False,
 ):
     return FileLayerLoader(
         filename=let.compile(filename),
@@ -191,6 +197,8 @@ def file_layer(
         is_enabled=None if is_enabled is None else let.compile(is_enabled),
         refresh_interval_s=let.compile(refresh_interval_s),
         retry_interval_s=let.compile(retry_interval_s),
+        max_refresh_interval_s=None if max_refresh_interval_s is None else let.compile(max_refresh_interval_s),
+        background_refresh=background_refresh,
     )
 
 
@@ -206,11 +214,15 @@ class FileLayerLoader:
             clear_on_removal=False,
             clear_on_fetch_failure=False,
             clear_on_load_failure=False,
+            max_refresh_interval_s=None,
+            background_refresh=False,
     ):
         self.file_fetcher = loaders.FileFetcher(filename, reader=reader)
         self.layer_constructor = layer_constructor or dynamic_layer_constructor(self.file_fetcher)
+        self.last_digest = None
+        self.last_layer = None
         self.auto_loader = loaders.AutoRefreshGetter(
-            layer_constructor=self.layer_constructor,
+            layer_constructor=self.construct_layer,
             fetcher=self.file_fetcher,
             refresh_interval_s=refresh_interval_s,
             retry_interval_s=retry_interval_s,
@@ -218,17 +230,33 @@ class FileLayerLoader:
             clear_on_removal=clear_on_removal,
             clear_on_fetch_failure=clear_on_fetch_failure,
             clear_on_load_failure=clear_on_load_failure,
+            max_refresh_interval_s=max_refresh_interval_s,
+            background_refresh=background_refresh,
         )
 
     def get_item(self, key, context, lower_layer: config.Layer) -> Tuple[int, int, Any | None]:
-        return self.auto_loader.read("", key.split("."), context, lower_layer)
+        layer = self.auto_loader.current_layer("", config.split_key(key), context, lower_layer)
+        return layer.get_item(key, context, lower_layer)
+
+    def construct_layer(self, data):
+        """Constructs a layer, reusing the last one if the file's contents are unchanged.
+
+        Touching a file updates its mtime without changing its contents, so the
+        fetcher can't tell that case apart from a real edit.
+
+        """
+        digest = (self.file_fetcher.filename, hashlib.blake2b(data, digest_size=16).digest())
+        if digest != self.last_digest:
+            self.last_layer = self.layer_constructor(data)
+            self.last_digest = digest
+        return self.last_layer
 
 
 def dynamic_layer_constructor(obj_with_filename):
 
     # noinspection PyShadowingNames
     def _wrapped(data, obj_with_filename=obj_with_filename):
-        layer_constructor = formats.layer_constructor_for_filename(obj_with_filename.filename)
+        layer_constructor = formats.layer_constructor_for_data(obj_with_filename.filename, data)
         return layer_constructor(data)
 
     return _wrapped
@@ -283,9 +311,11 @@ def sops_layer(
     )
 
 
-def cache(getter, ttl_s=gtrs.constant(60), negative_ttl_s=gtrs.constant(30)):
+def cache(getter, ttl_s=gtrs.constant(60), negative_ttl_s=gtrs.constant(30), max_entries=None, soft_ttl_s=None):
     return gtrs.CacheGetter(
         getter,
         ttl_s=let.compile(ttl_s),
-        negative_ttl_s=let.compile(negative_ttl_s))
+        negative_ttl_s=let.compile(negative_ttl_s),
+        max_entries=max_entries,
+        soft_ttl_s=None if soft_ttl_s is None else let.compile(soft_ttl_s))
 
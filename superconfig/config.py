@@ -1,49 +1,60 @@
 """Configuration library."""
 
+import collections
 import contextlib
+import contextvars
+import functools
+import sys
+import threading
+import time
 from typing import Any
 from typing import AnyStr
-from typing import NamedTuple
 from typing import Optional
 
 from superconfig import exceptions
 
 
-class Response(NamedTuple):
-    is_found: bool
-    must_stop: bool
-    go_next_layer: bool
-    value: Optional[Any]
-    expire: Optional[int]
+class Response:
+    """The outcome of looking a key up in a layer or getter.
+
+    Responses are never modified once built. The not-found variants are shared
+    singletons, and static layers build their found responses ahead of time.
+
+    expire, when set, is a time.monotonic() deadline. Every cache and refresh
+    in the library uses that clock, so stepping the wall clock can't keep an
+    entry alive or expire it early.
+    """
+    __slots__ = ("is_found", "must_stop", "go_next_layer", "value", "expire")
+
+    def __init__(self, is_found: bool, must_stop: bool, go_next_layer: bool, value: Optional[Any], expire: Optional[int] = None):
+        self.is_found = is_found
+        self.must_stop = must_stop
+        self.go_next_layer = go_next_layer
+        self.value = value
+        self.expire = expire
+
+    def __eq__(self, other):
+        if not isinstance(other, Response):
+            return NotImplemented
+        return (self.is_found, self.must_stop, self.go_next_layer, self.value, self.expire) == \
+            (other.is_found, other.must_stop, other.go_next_layer, other.value, other.expire)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "Response(is_found={!r}, must_stop={!r}, go_next_layer={!r}, value={!r}, expire={!r})".format(
+            self.is_found, self.must_stop, self.go_next_layer, self.value, self.expire)
 
     @classmethod
     def found(cls, value, expire=None):
-        return cls(
-            is_found=True,
-            must_stop=False,
-            go_next_layer=False,
-            value=value,
-            expire=expire,
-        )
+        return cls(True, False, False, value, expire)
 
     @classmethod
     def found_next(cls, value, expire=None):
-        return cls(
-            is_found=True,
-            must_stop=False,
-            go_next_layer=True,
-            value=value,
-            expire=expire,
-        )
+        return cls(True, False, True, value, expire)
 
     def new_value(self, x):
-        return Response(
-            is_found=self.is_found,
-            must_stop=self.must_stop,
-            go_next_layer=self.go_next_layer,
-            value=x,
-            expire=self.expire
-        )
+        return Response(self.is_found, self.must_stop, self.go_next_layer, x, self.expire)
 
     def has_expired(self, now):
         return self.expire is None or self.expire <= now
@@ -52,95 +63,202 @@ class Response(NamedTuple):
         return self.expire is not None and self.expire > now
 
     def cache_until(self, expire):
-        return Response(
-            is_found=self.is_found,
-            must_stop=self.must_stop,
-            go_next_layer=self.go_next_layer,
-            value=self.value,
-            expire=expire,
-        )
-
-Response.not_found = Response(
-    is_found=False,
-    must_stop=False,
-    go_next_layer=False,
-    value=None,
-    expire=None,
-)
-
-
-Response.not_found_stop = Response(
-    is_found=False,
-    must_stop=True,
-    go_next_layer=False,
-    value=None,
-    expire=None,
-)
-
-Response.not_found_next = Response(
-    is_found=False,
-    must_stop=False,
-    go_next_layer=True,
-    value=None,
-    expire=None,
-)
+        return Response(self.is_found, self.must_stop, self.go_next_layer, self.value, expire)
+
+
+Response.not_found = Response(False, False, False, None)
+Response.not_found_stop = Response(False, True, False, None)
+Response.not_found_next = Response(False, False, True, None)
+
+
+_globs = contextvars.ContextVar("superconfig_globs", default=None)
 
 
 class Context:
     """State which is passed between levels.
 
-    Allows separation between Config logic and layer state."""
+    Allows separation between Config logic and layer state.
 
-    def __init__(self):
-        self._globs = []
+    Globs are the values captured by a matched key pattern. They're kept as
+    the tuple of captured groups and looked up by position, so "{1}" is the
+    first capture.
+
+    The current globs live in a ContextVar, so threads and asyncio tasks
+    sharing one Config each see only the globs of their own lookup. One
+    module level ContextVar serves every Context, as the contextvars docs
+    advise. Its value is a chain of (context, globs, outer) links, and each
+    Context searches the chain for its own globs.
+    """
+
+    def __init__(self, globs=()):
+        self._base_globs = tuple(globs)
+
+    def _current_globs(self):
+        link = _globs.get()
+        while link is not None:
+            if link[0] is self:
+                return link[1]
+            link = link[2]
+        return self._base_globs
 
     @property
     def globs(self):
-        if not self._globs:
-            return {}
-        return self._globs[-1]
+        return {str(i+1): x for i, x in enumerate(self._current_globs())}
+
+    def glob(self, n: AnyStr) -> Optional[Any]:
+        """Returns the glob numbered n or None if there isn't one."""
+        if not n.isdecimal():
+            return None
+        groups = self._current_globs()
+        i = int(n) - 1
+        if i < 0 or i >= len(groups):
+            return None
+        return groups[i]
+
+    def snapshot(self):
+        """Copies the current globs into a new Context for use on another thread."""
+        return Context(self._current_globs())
 
     @contextlib.contextmanager
     def and_globs(self, g):
-        self._globs.append(g)
-        yield self
-        self._globs.pop()
-
+        token = _globs.set((self, tuple(g), _globs.get()))
+        try:
+            yield self
+        finally:
+            _globs.reset(token)
 
 
 class Layer:
+    __slots__ = ()
+
     def get_item(self, key: AnyStr, context: Context, lower_layer) -> Response:
         raise NotImplemented()
 
 
 class Config:
-    def __init__(self, context: Context, layer=None):
+    """Looks keys up in a layer.
+
+    With cache_size set, up to that many found values are kept in an LRU and
+    served without walking the layers. They are kept for ttl_s seconds, or
+    until invalidate() if ttl_s is None, and never past the expiry of the
+    response they came from. Threads share the cache, so it is only read and
+    changed under cache_lock.
+    """
+    __slots__ = ("context", "layer", "flat", "frozen_version", "cache_size", "ttl_s", "cache", "cache_lock")
+
+    def __init__(self, context: Context, layer=None, cache_size=0, ttl_s=None):
         self.context = context
         self.layer = layer
+        self.flat = {}
+        self.frozen_version = None
+        self.cache_size = cache_size
+        self.ttl_s = ttl_s
+        self.cache = collections.OrderedDict()
+        self.cache_lock = threading.Lock()
 
     def __getitem__(self, key: AnyStr) -> Optional[Any]:
-        resp = self._get_item(key, self.context, NullLayer)
+        resp = self._lookup(intern_key(key))
         if resp.is_found:
             return resp.value
         else:
             raise KeyError("key {} not found".format(key))
 
     def get(self, key: AnyStr, default: Optional[Any] = None) -> Optional[Any]:
-        resp = self._get_item(key, self.context, NullLayer)
+        resp = self._lookup(intern_key(key))
         if resp.is_found:
             return resp.value
         else:
             return default
 
-    def _get_item(self, *args, **kwargs):
+    def _lookup(self, key):
+        """Finds key in the frozen dict, then the cache, then the layers."""
+        if self.frozen_version is not None and self.frozen_version != self.layer.version:
+            self.freeze()
+        resp = self.flat.get(key)
+        if resp is not None:
+            return resp
         try:
-            return self.layer.get_item(*args, **kwargs)
+            if self.cache_size:
+                return self._cached_get_item(key)
+            return self.layer.get_item(key, self.context, NullLayer)
         except exceptions.ValueTransformException as e:
-            raise ValueError(
-                "could not parse value %s for key %s: %s",
-                e.raw_value,
-                e.key,
-                str(e.exception))
+            raise ValueError("could not parse value for key {}".format(e.key)) from e
+
+    def invalidate(self, key=None):
+        """Drops key, or every key, from the cache."""
+        with self.cache_lock:
+            if key is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(intern_key(key), None)
+
+    def _cached_get_item(self, key):
+        cache = self.cache
+        with self.cache_lock:
+            resp = cache.get(key)
+            if resp is not None and (resp.expire is None or resp.expire > time.monotonic()):
+                cache.move_to_end(key)
+                return resp
+        resp = self.layer.get_item(key, self.context, NullLayer)
+        if resp.is_found:
+            if self.ttl_s is not None:
+                expire = time.monotonic() + self.ttl_s
+                if resp.expire is None or resp.expire > expire:
+                    resp = resp.cache_until(expire)
+            with self.cache_lock:
+                cache[key] = resp
+                cache.move_to_end(key)
+                while len(cache) > self.cache_size:
+                    cache.popitem(last=False)
+        return resp
+
+    def freeze(self):
+        """Merges the static layers at the top of the stack into one dict.
+
+        Layers are merged from the top down until the first layer that can't
+        list its contents with flat_items(). Keys found in the merged dict skip
+        the layer walk entirely, and everything else is looked up as usual.
+        The dict holds found responses, like the cache and the layers return.
+
+        The dict is a snapshot of the layers. When the layer is a LayerCake,
+        pushing or popping a layer afterwards makes the next lookup merge the
+        dict again, so it never serves keys from a stack that has changed.
+
+        """
+        if isinstance(self.layer, LayerCake):
+            layers = self.layer
+            self.frozen_version = self.layer.version
+        else:
+            layers = [self.layer]
+        flat = {}
+        for layer in layers:
+            flat_items = getattr(layer, "flat_items", None)
+            if flat_items is None:
+                break
+            for k, v in flat_items():
+                k = intern_key(k)
+                if k not in flat:
+                    flat[k] = Response.found(v)
+        self.flat = flat
+        return self
+
+
+def intern_key(key):
+    """Interns str keys so dict probes against interned keys compare by identity."""
+    if type(key) is str:
+        return sys.intern(key)
+    return key
+
+
+@functools.lru_cache(maxsize=4096)
+def split_key(key):
+    """Splits key into a tuple of its dot separated segments.
+
+    Every layer in a stack is asked about the same key, and applications
+    keep asking for the same keys, so splits are cached. The segments are
+    interned, like the keys of the tries they're looked up in.
+    """
+    return tuple(sys.intern(segment) for segment in key.split("."))
 
 
 def layered_config(context, layers=None):
@@ -155,26 +273,110 @@ def layer_stack(layers):
 
 
 class LayerCake(Layer):
+    """A stack of layers searched from the top down.
+
+    Each layer sees the layers beneath it in the cake as its lower_layer,
+    and lookups that fall off the bottom go to the cake's own lower_layer.
+    The walk is a loop over a tuple that's rebuilt on every push or pop,
+    and version counts those changes.
+
+    A ConstantLayer answers every key, so the walk stops at the topmost one
+    and never visits the layers beneath it or the cake's lower_layer.
+
+    Layers with a key_prefixes() method promise to find nothing outside the
+    keys it lists, so a lookup skips them unless the key's first segment
+    matches one of theirs. A layer whose key_prefixes() returns None is
+    always visited. The layers that are called still see every
+    layer beneath them.
+
+    """
+    __slots__ = ("layers", "version", "_rev", "_steps", "_steps_by_segment", "_unindexed_steps")
+
     def __init__(self):
-        self.layers = TerminalLayer
+        self.layers = []
+        self.version = 0
+        self._rev = ()
+        self._steps = ()
+        self._steps_by_segment = {}
+        self._unindexed_steps = ()
 
     def push(self, layer):
-        self.layers = LinkedLayer(layer, self.layers)
+        self.layers.append(layer)
+        self._rebuild()
+
+    def pop(self):
+        """Removes and returns the top layer."""
+        layer = self.layers.pop()
+        self._rebuild()
+        return layer
+
+    def _rebuild(self):
+        self.version += 1
+        self._rev = tuple(reversed(self.layers))
+        live = self._rev
+        for i, layer in enumerate(self._rev):
+            if type(layer) is ConstantLayer:
+                live = self._rev[:i + 1]
+                break
+        # Bound once here so the walk doesn't look up get_item on every call.
+        self._steps = SubCake.build(tuple(layer.get_item for layer in live))
+        segments = [_first_segments(layer) for layer in live]
+        self._steps_by_segment = {
+            segment: tuple(step for step, owned in zip(self._steps, segments) if owned is None or segment in owned)
+            for owned in segments if owned is not None
+            for segment in owned
+        }
+        self._unindexed_steps = tuple(step for step, owned in zip(self._steps, segments) if owned is None)
+
+    def __iter__(self):
+        return iter(self._rev)
 
     def get_item(self, key: AnyStr, context: Context, lower_layer) -> Response:
-        return self.layers.get_item(key, context, lower_layer)
+        if self._steps_by_segment and type(key) is str:
+            steps = self._steps_by_segment.get(split_key(key)[0], self._unindexed_steps)
+            return _walk(steps, key, context, lower_layer)
+        return _walk(self._steps, key, context, lower_layer)
 
 
-class LinkedLayer(Layer):
-    def __init__(self, layer, sublayer):
-        self.layer = layer
-        self.sublayer = sublayer
+def _first_segments(layer):
+    key_prefixes = getattr(layer, "key_prefixes", None)
+    prefixes = None if key_prefixes is None else key_prefixes()
+    if prefixes is None:
+        return None
+    return frozenset(split_key(k)[0] for k in prefixes)
+
+
+class SubCake(Layer):
+    """The layers of a cake below a given position, seen as one layer."""
+    __slots__ = ("steps",)
+
+    def __init__(self, steps):
+        self.steps = steps
+
+    @classmethod
+    def build(cls, gets):
+        """Pairs each layer's bound get_item with the view of the layers below it.
+
+        The pairs are built from the bottom up, and each view holds the pairs
+        beneath its position, so a walk from any position is a plain loop.
+        """
+        steps = ()
+        for get in reversed(gets):
+            steps = ((get, cls(steps)),) + steps
+        return steps
 
     def get_item(self, key: AnyStr, context: Context, lower_layer) -> Response:
-        resp = self.layer.get_item(key, context, self.sublayer)
+        return _walk(self.steps, key, context, lower_layer)
+
+
+def _walk(steps, key, context, lower_layer):
+    for get, below in steps:
+        resp = get(key, context, below)
         if resp.is_found or resp.must_stop:
             return resp
-        return self.sublayer.get_item(key, context, lower_layer)
+    if lower_layer is NullLayer:
+        return Response.not_found
+    return lower_layer.get_item(key, context, NullLayer)
 
 
 class IndexLayer:
@@ -189,12 +391,6 @@ class IndexLayer:
         return Response.found(self.map[key])
 
 
-class TerminalLayer(Layer):
-    @classmethod
-    def get_item(cls, key: AnyStr, context: Context, lower_layer) -> Response:
-        return lower_layer.get_item(key, context, NullLayer)
-
-
 class NullLayer(Layer):
     @classmethod
     def get_item(cls, key, context, lower_layer):
@@ -212,7 +408,8 @@ class ConstantLayer(Layer):
     """
     def __init__(self, value):
         self.value = value
+        self.resp = Response.found(value)
 
     def get_item(self, key, context, lower_layer):
-        return Response.found(self.value)
+        return self.resp
 
@@ -1,68 +1,105 @@
 """Tools for building constructors from binary files.
 
 For example: You want to convert a base64 encoded
-file into a DictLayer(). To do this you'd build this
+file into an ObjLayer(). To do this you'd build this
 constructor:
 
     c = lambda f: ObjLayer(
         obj_from_json(
-            string_from_bytes(
-                bytes_from_base64(f),
-                encoding='utf8'
-            )
+            bytes_from_base64(f)
         )
     )
 
+or, as a single step that translates failures once:
+
+    c = lambda f: ObjLayer(pipeline(bytes_from_base64, obj_from_json)(f))
+
+obj_from_json and obj_from_yaml take bytes as well as strings, so there's
+no need to decode first. obj_from_toml and the ini and properties layers
+need strings, and that's where string_from_bytes belongs.
+
 
 """
 
 import binascii
 import base64
+import functools
 import io
 import json
+import operator
 from typing import Any
 from typing import AnyStr
 
-import toml
-
 from superconfig.exceptions import LoadFailure
 
 
 try:
-    from yaml import CDumper as Dumper
-    from yaml import CLoader as Loader
+    import orjson
+    _json_loads = orjson.loads
+    _json_error = orjson.JSONDecodeError
+except ImportError:
+    _json_loads = json.loads
+    _json_error = json.JSONDecodeError
+
+try:
+    from pybase64 import b64decode as _b64decode
 except ImportError:
-    from yaml import Loader, Dumper
+    _b64decode = base64.b64decode
 
-import yaml
 
+# yaml and toml are only imported the first time they're needed, so programs
+# that never read those formats don't pay for loading them.
+
+@functools.lru_cache(maxsize=None)
+def _toml_loads():
+    """Returns the TOML loader along with the error it raises."""
+    import toml
+    return toml.loads, toml.TomlDecodeError
+
+
+@functools.lru_cache(maxsize=None)
+def _yaml_load():
+    """Returns the YAML loader along with the error it raises."""
+    import yaml
+    try:
+        from yaml import CSafeLoader as SafeLoader
+    except ImportError:
+        from yaml import SafeLoader
+    return functools.partial(yaml.load, Loader=SafeLoader), yaml.YAMLError
+
+
+# Each parser's own decode error is caught by name, though today they're
+# all ValueErrors, as UnicodeDecodeError is. TypeError covers being handed
+# something that isn't text at all, and RecursionError deeply nested input.
 
 def obj_from_json(x: AnyStr) -> Any:
     try:
-        return json.loads(x)
-    except Exception:
-        raise LoadFailure()
+        return _json_loads(x)
+    except (_json_error, ValueError, TypeError, RecursionError) as e:
+        raise LoadFailure(e) from e
 
 
 def obj_from_toml(x: AnyStr) -> Any:
+    loads, toml_error = _toml_loads()
     try:
-        return toml.loads(x)
-    except Exception:
-        raise LoadFailure()
+        return loads(x)
+    except (toml_error, ValueError, TypeError, RecursionError) as e:
+        raise LoadFailure(e) from e
 
 
 def obj_from_yaml(x: AnyStr) -> Any:
+    load, yaml_error = _yaml_load()
     try:
-        return yaml.load(x, Loader=Loader)
-    except Exception as e:
-        raise LoadFailure(e)
+        return load(x)
+    except (yaml_error, ValueError, TypeError, RecursionError) as e:
+        raise LoadFailure(e) from e
 
 
 def string_from_bytes(x: bytes, encoding='utf8') -> AnyStr:
     try:
         return x.decode(encoding)
-    except Exception:
-        raise LoadFailure()
+    except (UnicodeError, LookupError) as e:
+        raise LoadFailure(e) from e
 
 
 def bytes_from_file(x: io.BytesIO) -> bytes:
@@ -71,7 +108,38 @@ def bytes_from_file(x: io.BytesIO) -> bytes:
 
 def bytes_from_base64(x: AnyStr) -> bytes:
     try:
-        return base64.b64decode(x, validate=True)
-    except binascii.Error:
-        raise LoadFailure("characters outside base64")
-
+        return _b64decode(x, validate=True)
+    except binascii.Error as e:
+        raise LoadFailure("characters outside base64") from e
+
+
+def pipeline(*steps):
+    """Chains converters, applied left to right, into one function.
+
+    The converters defined here are swapped for the calls they wrap, and
+    their decode errors are turned into a LoadFailure once around the whole
+    chain rather than by a try block at every step. Any other exception is
+    a bug rather than bad data, and is left to propagate.
+    """
+    calls = tuple(_unwrapped.get(step, step) for step in steps)
+
+    def run(x):
+        try:
+            for call in calls:
+                x = call(x)
+            return x
+        except _decode_errors as e:
+            raise LoadFailure(e) from e
+    return run
+
+
+# What the unwrapped calls raise on bad data. The YAML and TOML converters
+# aren't unwrapped, so they still raise LoadFailure themselves.
+_decode_errors = (_json_error, UnicodeError, LookupError, binascii.Error, ValueError, TypeError, RecursionError)
+
+_unwrapped = {
+    obj_from_json: _json_loads,
+    string_from_bytes: bytes.decode,
+    bytes_from_file: operator.methodcaller("read"),
+    bytes_from_base64: functools.partial(_b64decode, validate=True),
+}
@@ -10,6 +10,9 @@ class ValueTransformException(Exception):
         self.raw_value = raw_value
         self.exception = exception
 
+    def __str__(self):
+        return "could not transform value {!r} for key {}: {}".format(self.raw_value, self.key, self.exception)
+
 
 class FetchFailure(Exception):
     pass
@@ -1,6 +1,11 @@
+import collections
+import hashlib
 import os
+import re
+import threading
 from typing import AnyStr
 from typing import List
+from typing import Optional
 
 import aenum
 
@@ -22,6 +27,7 @@ layer_constructor_by_format = {}
 
 def register_layer_constructor(format: Format, layer_constructor) -> None:
     layer_constructor_by_format[format.value] = layer_constructor
+    _index_suffixes()
 
 
 format_by_suffix = {}
@@ -30,13 +36,142 @@ format_by_suffix = {}
 def register_file_formats(format: Format, suffixes: List[AnyStr]) -> None:
     for suffix in suffixes:
         format_by_suffix[suffix] = format
+    _index_suffixes()
+
+
+# Suffixes mapped straight to their layer constructors, so resolving a
+# filename is one probe. It's rebuilt whenever either registry changes.
+layer_constructor_by_suffix = {}
+
+
+def _index_suffixes():
+    layer_constructor_by_suffix.clear()
+    for suffix, format in format_by_suffix.items():
+        if format.value in layer_constructor_by_format:
+            layer_constructor_by_suffix[suffix] = layer_constructor_by_format[format.value]
+
+
+_parse_caches = []
+
+
+class _ParseCache:
+    """Shares the layers most recently built from identical bytes.
+
+    Layers are keyed on a blake2b digest of the bytes, like
+    FileLayerLoader.construct_layer keys its last layer, so the bodies
+    themselves aren't kept alive.
+    """
+    def __init__(self, layer_constructor, maxsize):
+        self.layer_constructor = layer_constructor
+        self.maxsize = maxsize
+        self.layers = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def __call__(self, data):
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        with self.lock:
+            layer = self.layers.get(digest)
+            if layer is not None:
+                self.layers.move_to_end(digest)
+                return layer
+        layer = self.layer_constructor(data)
+        with self.lock:
+            self.layers[digest] = layer
+            while len(self.layers) > self.maxsize:
+                self.layers.popitem(last=False)
+        return layer
+
+    def cache_clear(self):
+        with self.lock:
+            self.layers.clear()
+
+
+def memoized(layer_constructor, maxsize=8):
+    """Shares layers built from identical bytes.
+
+    Only use this for constructors whose layers never hand out mutable
+    parts of the parsed data. ObjLayer only returns leaves, so its parse
+    results can be shared safely.
+
+    """
+    cached = _ParseCache(layer_constructor, maxsize)
+    _parse_caches.append(cached)
+    return cached
+
+
+def invalidate_parse_cache():
+    for cached in _parse_caches:
+        cached.cache_clear()
 
 
 def layer_constructor_for_filename(filename):
     _, suffix = os.path.splitext(filename)
-    if suffix not in format_by_suffix:
-        raise KeyError("suffix %r not known" % suffix)
-    return layer_constructor_by_format[format_by_suffix[suffix].value]
+    try:
+        return layer_constructor_by_suffix[suffix]
+    except KeyError:
+        raise KeyError("suffix %r not known" % suffix) from None
+
+
+_ini_section_ptrn = re.compile(rb"\[[\w .-]+]\s*$")
+_yaml_line_ptrn = re.compile(rb"[^\s:=#!][^:=]*:(\s|$)")
+_properties_line_ptrn = re.compile(rb"[^\s:=#!][^:=]*=")
+# Values TOML accepts: strings, arrays, inline tables, booleans, numbers and dates.
+_toml_value_ptrn = re.compile(
+    rb"""\s*(["'[{]|\d{4}-\d{2}-\d{2}|(true|false|[+-]?(inf|nan)|[+-]?\d[\d_]*(\.[\d_]+)?([eE][+-]?\d+)?)\s*(#|$))""")
+
+
+def detect_format(data: bytes) -> Optional[Format]:
+    """Guesses the format of a config from its first significant line.
+
+    Returns None when nothing matches. TOML can't be told apart from INI this
+    way, so it's never guessed. For the same reason key=value lines are only
+    taken as Properties when something in the file isn't valid TOML, like a
+    "!" comment or an unquoted string value.
+
+    """
+    data = data.lstrip()
+    if data.startswith(b"{"):
+        return Format.Json
+    if data.startswith(b"---"):
+        return Format.Yaml
+    lines = data.splitlines()
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith((b"#", b"!", b";")):
+            continue
+        if line.startswith(b"["):
+            return Format.Ini if _ini_section_ptrn.match(line) else Format.Json
+        if _yaml_line_ptrn.match(line):
+            return Format.Yaml
+        if _properties_line_ptrn.match(line):
+            return Format.Properties if _has_non_toml_property(lines) else None
+        return None
+    return None
+
+
+def _has_non_toml_property(lines):
+    """True if some line of a key=value file could only be a Java property."""
+    for line in lines:
+        line = line.strip()
+        if line.startswith(b"!"):
+            return True
+        if not line or line.startswith((b"#", b"[")):
+            continue
+        key, sep, value = line.partition(b"=")
+        if sep and not _toml_value_ptrn.match(value):
+            return True
+    return False
+
+
+def layer_constructor_for_data(filename, data):
+    """Chooses a constructor by filename suffix, falling back to the content."""
+    _, suffix = os.path.splitext(filename)
+    if suffix in layer_constructor_by_suffix:
+        return layer_constructor_by_suffix[suffix]
+    format = detect_format(data)
+    if format is None:
+        raise KeyError("suffix %r not known and format not detected" % suffix)
+    return layer_constructor_by_format[format.value]
 
 
 def layer_constructor_for_format(format):
@@ -46,38 +181,37 @@ def layer_constructor_for_format(format):
 register_format("Properties")
 register_layer_constructor(
     Format.Properties,
-    lambda x: statics.PropertiesLayer.from_string(converters.string_from_bytes(x, encoding='utf8'))
+    memoized(lambda x: statics.PropertiesLayer.from_string(converters.string_from_bytes(x, encoding='utf8')))
 )
 register_file_formats(Format.Properties, [".prop", ".props", ".properties"])
 
 register_format("Ini")
 register_layer_constructor(
     Format.Ini,
-    lambda x: statics.IniLayer.from_string(converters.string_from_bytes(x, encoding='utf8'))
+    memoized(lambda x: statics.IniLayer.from_string(converters.string_from_bytes(x, encoding='utf8')))
 )
 register_file_formats(Format.Ini, [".ini"])
 
 register_format("Json")
 register_layer_constructor(
     Format.Json,
-    lambda x: statics.ObjLayer(
-        converters.obj_from_json(converters.string_from_bytes(x, encoding='utf8')))
+    memoized(lambda x: statics.ObjLayer(converters.obj_from_json(x)))
 )
 register_file_formats(Format.Json, [".json"])
 
+_obj_from_toml_bytes = converters.pipeline(converters.string_from_bytes, converters.obj_from_toml)
+
 register_format("Toml")
 register_layer_constructor(
     Format.Toml,
-    lambda x: statics.ObjLayer(
-        converters.obj_from_toml(converters.string_from_bytes(x, encoding='utf8')))
+    memoized(lambda x: statics.ObjLayer(_obj_from_toml_bytes(x)))
 )
 register_file_formats(Format.Toml, [".toml"])
 
 register_format("Yaml")
 register_layer_constructor(
     Format.Yaml,
-    lambda x: statics.ObjLayer(
-        converters.obj_from_yaml(converters.string_from_bytes(x, encoding='utf8')))
+    memoized(lambda x: statics.ObjLayer(converters.obj_from_yaml(x)))
 )
 register_file_formats(Format.Yaml, [".yaml", ".yml"])
 
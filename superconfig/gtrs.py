@@ -1,8 +1,12 @@
 """Perform specific actions for specific keys."""
 
 import collections
+import concurrent.futures
+import logging
+import math
 import os
 import re
+import threading
 import time
 from typing import Any
 from typing import AnyStr
@@ -14,50 +18,164 @@ from superconfig import config
 from superconfig import exceptions
 from superconfig import helpers
 
+logger = logging.getLogger(__name__)
+
 
 class GetterLayer(config.Layer):
-    """Attache"""
+    """Attaches getters to keys.
+
+    Constant keys live in a trie keyed on the key's dot separated segments,
+    so a lookup stops probing for constant keys as soon as no registered key
+    shares its prefix. Keys containing {} wildcards live in a second trie
+    whose wildcard segments match any non-empty segment. Both are walked
+    once, segment by segment, alongside each other. A getter on the empty
+    key is also kept aside as the root getter, which sees every lookup.
+
+    Once frozen, no more getters can be added, and a layer holding only
+    constant keys lists their first segments through key_prefixes() so a
+    LayerCake it's pushed onto afterwards can skip it for other keys.
+
+    """
     def __init__(self, getters=None):
         if getters is None:
             getters = {}
-        self.constant_key_getters = {}
-        self.key_pattern_getters = collections.defaultdict(list)
+        self.root_getter = None
+        self.constant_key_trie = KeyTrie()
+        self.key_pattern_trie = PatternTrie()
+        self.pattern_count = 0
+        self.frozen = False
         for key, getter in getters.items():
             self[key] = getter
 
+    def freeze(self):
+        self.frozen = True
+        return self
+
+    def key_prefixes(self):
+        if not self.frozen or self.root_getter is not None or self.pattern_count:
+            return None
+        return self.constant_key_trie.children.keys()
+
     def __setitem__(self, key, getter):
+        if self.frozen:
+            raise TypeError("can't add getters to a frozen GetterLayer")
+        key = config.intern_key(key)
         if "{}" not in key:
-            self.constant_key_getters[key] = getter
+            if key == "":
+                self.root_getter = getter
+            self.constant_key_trie.insert(key.split("."), getter)
         else:
-            n = len(key.split("."))
-            self.key_pattern_getters[n].append((re.compile("^{}$".format(key.replace("{}", r"([^.]+)"))), getter))
+            self.key_pattern_trie.insert(key.split("."), self.pattern_count, getter)
+            self.pattern_count += 1
 
     def get_item(self, key: AnyStr, context: config.Context, lower_layer: config.Layer) -> Tuple[int, int, Optional[Any]]:
-        if key == "" and "" not in self.constant_key_getters:
+        if key == "" and self.root_getter is None:
             return config.Response.not_found
-        indexes = key.split(".")
-        if "" in self.constant_key_getters:
-            resp = self.constant_key_getters[""].read("", indexes[0:len(indexes)], context, lower_layer)
+        indexes = config.split_key(key)
+        if self.root_getter is not None:
+            resp = self.root_getter.read("", indexes, context, lower_layer)
             if resp.is_found or resp.must_stop or resp.go_next_layer:
                 return resp
+        node = self.constant_key_trie
+        states = [(self.key_pattern_trie, ())] if self.pattern_count else []
+        # The prefix ending at segment i is key[:end], so prefixes are sliced
+        # from the key as they are needed instead of joined from segments.
+        end = -1
         for i in range(1, len(indexes)+1):
-            k = ".".join(indexes[0:i])
-            if k in self.constant_key_getters:
-                resp = self.constant_key_getters[k].read(k, indexes[i:len(indexes)], context, lower_layer)
-                if resp.is_found or resp.must_stop or resp.go_next_layer:
-                    return resp
-            for ptrn, getter in self.key_pattern_getters[i]:
-                match = ptrn.search(k)
-                if not match:
-                    continue
-                globs = {str(j+1): x for j, x in enumerate(match.groups())}
+            if node is None and not states:
+                break
+            end += len(indexes[i-1]) + 1
+            if node is not None:
+                node = node.children.get(indexes[i-1])
+                if node is not None and node.getter is not None:
+                    resp = node.getter.read(key[:end], indexes[i:], context, lower_layer)
+                    if resp.is_found or resp.must_stop or resp.go_next_layer:
+                        return resp
+            if not states:
+                continue
+            states = PatternTrie.step(states, indexes[i-1])
+            for _, getter, globs in PatternTrie.matches(states):
                 with context.and_globs(globs) as ctx:
-                    resp = getter.read(k, indexes[i:len(indexes)], ctx, lower_layer)
+                    resp = getter.read(key[:end], indexes[i:], ctx, lower_layer)
                 if resp.is_found or resp.must_stop or resp.go_next_layer:
                     return resp
         return config.Response.not_found
 
 
+class KeyTrie:
+    """Maps dot separated key segments to getters."""
+    def __init__(self):
+        self.getter = None
+        self.children = {}
+
+    def insert(self, segments, getter):
+        node = self
+        for segment in segments:
+            node = node.children.setdefault(config.intern_key(segment), KeyTrie())
+        node.getter = getter
+
+
+class PatternTrie:
+    """Maps dot separated key patterns to getters.
+
+    A segment is either literal, exactly {} which matches any non-empty
+    segment, or text around one or more {} which is matched with a regex.
+    Whatever the wildcards match becomes the globs for the getter. Getters
+    are tried in the order they were registered.
+
+    """
+    def __init__(self):
+        self.getters = []
+        self.children = {}
+        self.wildcards = []
+
+    def insert(self, segments, order, getter):
+        node = self
+        for segment in segments:
+            if "{}" not in segment:
+                node = node.children.setdefault(config.intern_key(segment), PatternTrie())
+            else:
+                node = node.wildcard_child(segment)
+        node.getters.append((order, getter))
+
+    def wildcard_child(self, segment):
+        ptrn = None
+        if segment != "{}":
+            ptrn = re.compile(r"([^.]+)".join(re.escape(x) for x in segment.split("{}")))
+        for p, child in self.wildcards:
+            if (p is None and ptrn is None) or (p is not None and ptrn is not None and p.pattern == ptrn.pattern):
+                return child
+        child = PatternTrie()
+        self.wildcards.append((ptrn, child))
+        return child
+
+    @staticmethod
+    def step(states, segment):
+        """Advances every (node, globs) state past segment."""
+        next_states = []
+        for node, globs in states:
+            child = node.children.get(segment)
+            if child is not None:
+                next_states.append((child, globs))
+            for ptrn, child in node.wildcards:
+                if ptrn is None:
+                    if segment:
+                        next_states.append((child, globs + (segment,)))
+                    continue
+                match = ptrn.fullmatch(segment)
+                if match:
+                    next_states.append((child, globs + match.groups()))
+        return next_states
+
+    @staticmethod
+    def matches(states):
+        """The (order, getter, globs) for patterns ending at states, in registration order."""
+        found = [(order, getter, globs) for node, globs in states for order, getter in node.getters]
+        if len(found) > 1:
+            found.sort(key=lambda x: x[0])
+        return found
+
+
 class Getter:
     """Get the value for a key at a specific point in the key search.
 
@@ -66,14 +184,16 @@ class Getter:
     access to layers of config beneath them.
 
     """
-    def read(self, key: AnyStr, rest: AnyStr, context: config.Context, lower_layer: config.Layer):
+    __slots__ = ()
+
+    def read(self, key: AnyStr, rest: Tuple[AnyStr, ...], context: config.Context, lower_layer: config.Layer):
         raise NotImplementedError()
 
 
 
 def via(getter, key="", rest=None):
     if rest is None:
-        rest = []
+        rest = ()
 
     # noinspection PyShadowingNames
     def f(context, lower_layer, key=key, getter=getter, rest=rest):
@@ -82,26 +202,22 @@ def via(getter, key="", rest=None):
 
 
 def expansion(c):
-    expansions = helpers.expansions(c)
-    if not expansions:
+    tmpl = helpers.expandable(c)
+    if tmpl.is_constant:
         return config_value_constant_key(c)
-
-    # noinspection PyShadowingNames
-    def f(context, lower_layer, c=c, expansions=expansions):
-        return helpers.expand(c, expansions, context, lower_layer)
-    return f
+    return tmpl.expand
 
 
 def config_value(key):
-    expansions = helpers.expansions(key)
-    if not expansions:
+    tmpl = helpers.expandable(key)
+    if tmpl.is_constant:
         return config_value_constant_key(key)
 
     # noinspection PyShadowingNames
-    def f(context, lower_layer, key=key, expansions=expansions):
-        target_key = helpers.expand(key, expansions, context, lower_layer)
-        resp = lower_layer.get_item(target_key, context, config.NullConfig)
-        if not resp.found:
+    def f(context, lower_layer, expand=tmpl.expand):
+        target_key = expand(context, lower_layer)
+        resp = lower_layer.get_item(target_key, context, config.NullLayer)
+        if not resp.is_found:
             raise KeyError()
         return resp.value
     return f
@@ -112,7 +228,7 @@ def config_value_constant_key(key):
     # noinspection PyShadowingNames
     def f(context, lower_layer, key=key):
         resp = lower_layer.get_item(key, context, config.NullLayer)
-        if not resp.found:
+        if not resp.is_found:
             raise KeyError()
         return resp.value
     return f
@@ -126,35 +242,64 @@ def expanded(f):
 
     def _expansion(context, lower_layer):
         x = f(context, lower_layer)
-        return helpers.expand(x, helpers.expansions(x), context, lower_layer)
+        return helpers.expandable(x).expand(context, lower_layer)
     return _expansion
 
 
 class GetterStack(Getter):
     """Applies getters one after another to the same key.
 
+    The getters are fixed when the stack is built, so their read methods
+    are bound once up front and the stack just walks a tuple of them.
 
     """
+    __slots__ = ("getters", "reads")
+
     def __init__(self, getters: Iterable[Getter]):
-        self.getters = getters
+        self.getters = tuple(getters)
+        self.reads = tuple(g.read for g in self.getters)
 
     def read(self, key, res, context, lower_layer):
-        for g in self.getters:
-            resp = g.read(key, res, context, lower_layer)
+        for read in self.reads:
+            resp = read(key, res, context, lower_layer)
             if resp.is_found or resp.must_stop:
                 return resp
         return config.Response.not_found
 
 
+_environ = os.environ
+
+
+def snapshot_env():
+    """Makes Env getters read from a copy of the environment taken now.
+
+    os.environ decodes and re-encodes on every access, while the copy is a
+    plain dict. Later changes to the environment aren't seen until
+    snapshot_env() is called again, or live_env() switches back.
+    """
+    global _environ
+    _environ = dict(os.environ)
+
+
+def live_env():
+    """Makes Env getters read os.environ directly again."""
+    global _environ
+    _environ = os.environ
+
+
 class Env(Getter):
     """Gets a key from an environment variable."""
+    __slots__ = ("envar",)
+
     def __init__(self, envar: AnyStr):
         self.envar = envar
 
     def read(self, key, rest, context, lower_layer):
-        if self.envar not in os.environ:
+        # Environment values are always strings, so None can only mean unset.
+        value = _environ.get(self.envar)
+        if value is None:
             return config.Response.not_found
-        return config.Response.found(os.environ[self.envar])
+        return config.Response.found(value)
 
 
 class Transform(Getter):
@@ -184,9 +329,10 @@ class Constant(Getter):
     """Always returns the assigned constant."""
     def __init__(self, c: Any):
         self.c = c
+        self.resp = config.Response.found(c)
 
     def read(self, key, res, context, lower_layer):
-        return config.Response.found(self.c)
+        return self.resp
 
 
 class NotFound(Getter):
@@ -209,6 +355,11 @@ class Stop(Getter):
         return config.Response.not_found_stop
 
 
+# Neither getter has any state, so one instance of each serves every stack.
+not_found = NotFound()
+stop = Stop()
+
+
 class IgnoreTransformErrors(Getter):
     """Turns getter's transform errors into NotFound"""
     def __init__(self, getter):
@@ -234,7 +385,7 @@ class Counter(Getter):
 class KeyExpansionLayer(config.Layer):
 
     def get_item(self, key: AnyStr, context: config.Context, lower_layer: config.Layer) -> Tuple[int, int, Optional[Any]]:
-        k = helpers.expand(key, helpers.expansions(key), context, lower_layer)
+        k = helpers.expandable(key).expand(context, lower_layer)
         if k is None:
             return config.Response.not_found
         return lower_layer.get_item(k, context, config.NullLayer)
@@ -258,11 +409,11 @@ class CacheLayer:
         self.negative_ttl_s = negative_ttl_s
 
     def get_item(self, key: AnyStr, context: config.Context, lower_layer: config.Layer) -> config.Response:
-        now = time.time()
+        now = time.monotonic()
         cached_resp = self.cache.get(key, None)
         if cached_resp is not None and cached_resp.still_unexpired(now):
             return cached_resp
-        resp = lower_layer.get_item(key, context, config.NullLayer())
+        resp = lower_layer.get_item(key, context, config.NullLayer)
         if resp.is_found:
             return _cache(self.cache, key, resp, now, self.ttl_s(context, lower_layer))
         if not self.negative_ttl_s(context, lower_layer):
@@ -280,38 +431,117 @@ class CacheLayer:
 
 
 class CacheGetter(Getter):
-    def __init__(self, getter, ttl_s=constant(5), negative_ttl_s=constant(0)):
+    """Caches responses from getter for ttl_s, or negative_ttl_s for misses.
+
+    With max_entries set the cache becomes an LRU holding at most that many
+    keys, so a getter serving an open-ended key space can't grow it without
+    bound. The cache is shared between threads, so lookups, the LRU
+    bookkeeping and the refresh deadlines are all handled under cache_lock.
+
+    With soft_ttl_s set, a value older than soft_ttl_s but younger than ttl_s
+    is still returned, and a refresh of that key is started on the shared
+    refresh pool. Only once ttl_s has passed does a read wait on the getter.
+    """
+    def __init__(self, getter, ttl_s=constant(5), negative_ttl_s=constant(0), max_entries=None, soft_ttl_s=None):
         self.getter = getter
-        self.cache = {}
+        self.cache = collections.OrderedDict()
         self.ttl_s = ttl_s
         self.negative_ttl_s = negative_ttl_s
-
-    def read(self, key: AnyStr, rest: list[AnyStr], context: config.Context, lower_layer: config.Layer) -> config.Response:
-        now = time.time()
+        self.max_entries = max_entries
+        self.soft_ttl_s = soft_ttl_s
+        self.refresh_after = {}
+        self.refreshing = set()
+        self.refresh_lock = threading.Lock()
+        self.cache_lock = threading.Lock()
+
+    def read(self, key: AnyStr, rest: Tuple[AnyStr, ...], context: config.Context, lower_layer: config.Layer) -> config.Response:
+        now = time.monotonic()
         cache_key = full_key(key, rest)
-        cached_resp = self.cache.get(cache_key, None)
-        if cached_resp is not None and cached_resp.still_unexpired(now):
+        with self.cache_lock:
+            cached_resp = self.cache.get(cache_key, None)
+            is_fresh = cached_resp is not None and cached_resp.still_unexpired(now)
+            if is_fresh and self.max_entries is not None:
+                self.cache.move_to_end(cache_key)
+            refresh_after = self.refresh_after.get(cache_key, math.inf)
+        if is_fresh:
+            if self.soft_ttl_s is not None and refresh_after <= now:
+                self.refresh_in_background(now, cache_key, key, rest, context, lower_layer)
             return cached_resp
+        return self.fetch(now, cache_key, key, rest, context, lower_layer)
+
+    def fetch(self, now, cache_key, key, rest, context, lower_layer):
         resp = self.getter.read(key, rest, context, lower_layer)
         if resp.is_found:
-            return _cache(self.cache, cache_key, resp, now, self.ttl_s(constant, lower_layer))
-        if not self.negative_ttl_s(context, lower_layer):
-            return resp
-        return _cache(self.cache, cache_key, resp, now, self.negative_ttl_s(constant, lower_layer))
+            ttl_s = self.ttl_s(context, lower_layer)
+        else:
+            ttl_s = self.negative_ttl_s(context, lower_layer)
+            if not ttl_s:
+                return resp
+        refresh_after = None
+        if self.soft_ttl_s is not None and resp.is_found:
+            refresh_after = now + self.soft_ttl_s(context, lower_layer)
+        with self.cache_lock:
+            resp = _cache(self.cache, cache_key, resp, now, ttl_s)
+            if refresh_after is not None:
+                self.refresh_after[cache_key] = refresh_after
+            if self.max_entries is not None:
+                self.cache.move_to_end(cache_key)
+                while len(self.cache) > self.max_entries:
+                    evicted, _ = self.cache.popitem(last=False)
+                    self.refresh_after.pop(evicted, None)
+        return resp
+
+    def refresh_in_background(self, now, cache_key, key, rest, context, lower_layer):
+        with self.refresh_lock:
+            if cache_key in self.refreshing:
+                return
+            self.refreshing.add(cache_key)
+        try:
+            refresh_pool().submit(self.refresh, now, cache_key, key, tuple(rest), context.snapshot(), lower_layer)
+        except Exception:
+            self.refreshing.discard(cache_key)
+            raise
+
+    def refresh(self, now, cache_key, key, rest, context, lower_layer):
+        # Nothing waits on the refresh's future, so failures are logged here
+        # and the stale value stays in place until ttl_s passes. Like
+        # AutoRefreshGetter's background loads, the new deadlines count from
+        # the read that started the refresh.
+        try:
+            self.fetch(now, cache_key, key, rest, context, lower_layer)
+        except Exception:
+            logger.exception("background refresh of %s failed", cache_key)
+        finally:
+            with self.refresh_lock:
+                self.refreshing.discard(cache_key)
+
+
+_refresh_pool = None
+_refresh_pool_lock = threading.Lock()
+
+
+def refresh_pool():
+    """The worker pool shared by all background refreshes."""
+    global _refresh_pool
+    with _refresh_pool_lock:
+        if _refresh_pool is None:
+            _refresh_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=2, thread_name_prefix="superconfig-refresh")
+        return _refresh_pool
 
 
 class ExpansionGetter(Getter):
     def __init__(self, getter):
         self.getter = getter
 
-    def read(self, key: AnyStr, rest: list[AnyStr], context: config.Context, lower_layer: config.Layer) -> config.Response:
+    def read(self, key: AnyStr, rest: Tuple[AnyStr, ...], context: config.Context, lower_layer: config.Layer) -> config.Response:
         resp = self.getter(key, rest, context, lower_layer)
         if not resp.is_found:
             return resp
-        expansions = helpers.expansions(resp.value)
-        if not expansions:
+        tmpl = helpers.expandable(resp.value)
+        if tmpl.is_constant:
             return resp
-        return resp.new_value(helpers.expand(resp.value, expansions, context, lower_layer))
+        return resp.new_value(tmpl.expand(context, lower_layer))
 
 
 def _cache(cache, cache_key, resp, now, ttl_s):
@@ -331,7 +561,7 @@ class IndexGetterLayer:
     def get_item(self, key, context, lower_layer):
         if key not in self.map:
             return config.Response.not_found_next
-        return self.map[key].read(key, [], context, lower_layer)
+        return self.map[key].read(key, (), context, lower_layer)
 
 
 class GetterAsLayer(config.Layer):
@@ -339,7 +569,7 @@ class GetterAsLayer(config.Layer):
         self.getter = getter
 
     def get_item(self, key, context, lower_layer: config.Layer) -> config.Response:
-        return self.getter.read("", key.split("."), context, lower_layer)
+        return self.getter.read("", config.split_key(key), context, lower_layer)
 
 
 def full_key(key, rest):
@@ -347,12 +577,12 @@ def full_key(key, rest):
 
 
 class BaseKeyReference(Getter):
-    def read(self, key: AnyStr, rest: list[AnyStr], context: config.Context, lower_layer: config.Layer) -> config.Response:
+    def read(self, key: AnyStr, rest: Tuple[AnyStr, ...], context: config.Context, lower_layer: config.Layer) -> config.Response:
         return lower_layer.get_item(key, context, config.NullLayer)
 
 
 class FullKeyReference(Getter):
-    def read(self, key: AnyStr, rest: list[AnyStr], context: config.Context, lower_layer: config.Layer) -> config.Response:
+    def read(self, key: AnyStr, rest: Tuple[AnyStr, ...], context: config.Context, lower_layer: config.Layer) -> config.Response:
         return lower_layer.get_item(full_key(key, rest), context, config.NullLayer)
 
 
@@ -360,11 +590,11 @@ class ExpansionGetter(Getter):
     def __init__(self, getter):
         self.getter = getter
 
-    def read(self, key: AnyStr, rest: list[AnyStr], context: config.Context, lower_layer: config.Layer) -> config.Response:
+    def read(self, key: AnyStr, rest: Tuple[AnyStr, ...], context: config.Context, lower_layer: config.Layer) -> config.Response:
         resp = self.getter.read(key, rest, context, lower_layer)
-        if not resp.found:
+        if not resp.is_found:
             return resp
-        x = helpers.expand(resp.value, helpers.expansions(resp.value), context, lower_layer)
+        x = helpers.expandable(resp.value).expand(context, lower_layer)
         return resp.new_value(x)
 
 
@@ -372,24 +602,24 @@ class BaseKeyGetter():
     def __init__(self, getter):
         self.getter = getter
 
-    def read(self, key: AnyStr, rest: list[AnyStr], context: config.Context, lower_layer: config.Layer) -> config.Response:
-        return self.getter.read(key, [], context, lower_layer)
+    def read(self, key: AnyStr, rest: Tuple[AnyStr, ...], context: config.Context, lower_layer: config.Layer) -> config.Response:
+        return self.getter.read(key, (), context, lower_layer)
 
 
 class ExpandedKeyGetter():
     def __init__(self, getter):
         self.getter = getter
 
-    def read(self, key: AnyStr, rest: list[AnyStr], context: config.Context, lower_layer: config.Layer) -> config.Response:
-        expanded_key = helpers.expand(key, helpers.expansions(key), context, lower_layer)
-        return self.getter.read(expanded_key, [], context, lower_layer)
+    def read(self, key: AnyStr, rest: Tuple[AnyStr, ...], context: config.Context, lower_layer: config.Layer) -> config.Response:
+        expanded_key = helpers.expandable(key).expand(context, lower_layer)
+        return self.getter.read(expanded_key, (), context, lower_layer)
 
 
 class FullKeyGetter():
     def __init__(self, getter):
         self.getter = getter
 
-    def read(self, key: AnyStr, rest: list[AnyStr], context: config.Context, lower_layer: config.Layer) -> config.Response:
-        return self.getter.read(full_key(key, rest), [], context, lower_layer)
+    def read(self, key: AnyStr, rest: Tuple[AnyStr, ...], context: config.Context, lower_layer: config.Layer) -> config.Response:
+        return self.getter.read(full_key(key, rest), (), context, lower_layer)
 
 
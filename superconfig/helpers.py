@@ -1,4 +1,7 @@
+import functools
 import re
+import sys
+from typing import Any
 from typing import AnyStr
 from typing import Optional
 
@@ -6,39 +9,83 @@ from superconfig import config
 
 
 class ExpandableString:
+    """A template compiled once into its literal text and expansion names.
+
+    Splitting on the expansion pattern leaves the literals at the even
+    positions and the names at the odd ones. The empty literals between
+    adjacent expansions are dropped, and expanding copies the remaining
+    pieces, drops each value into its name's slot, and joins once.
+    Templates without expansions expand to themselves without any lookups.
+    """
     def __init__(self, name):
         self.name = name
         self.expansions = expansions(name)
+        parts = expansions_ptrn.split(name)
+        parts[1::2] = [sys.intern(exp) for exp in parts[1::2]]
+        self.literals = parts[0::2]
+        self.names = parts[1::2]
+        self.is_constant = not self.names
+        pieces = []
+        slots = []
+        for i, part in enumerate(parts):
+            if i % 2:
+                slots.append((len(pieces), part))
+                pieces.append(None)
+            elif part:
+                pieces.append(part)
+        self.pieces = tuple(pieces)
+        self.slots = tuple(slots)
 
     def expand(self, context: config.Context, lower_layer: config.Layer) -> Optional[AnyStr]:
-        return expand(self.name, self.expansions, context, lower_layer)
+        if self.is_constant:
+            return self.name
+        values = {}
+        for exp in self.expansions:
+            v = resolve(exp, context, lower_layer)
+            if v is None:
+                return None
+            values[exp] = v
+        pieces = list(self.pieces)
+        for i, name in self.slots:
+            pieces[i] = values[name]
+        return "".join(pieces)
+
+
+@functools.lru_cache(maxsize=1024)
+def expandable(tmpl):
+    """Compiles tmpl, reusing the result for templates seen recently."""
+    return ExpandableString(tmpl)
 
 
 expansions_ptrn = re.compile(r"\{([^}]+)}")
 
 
+@functools.lru_cache(maxsize=4096)
 def expansions(tmpl):
-    return set(expansions_ptrn.findall(tmpl))
+    """The distinct expansion names in tmpl, cached since templates repeat.
+
+    The names are interned, so the same name used by many templates is held
+    once and matches the interned segments that keys are split into.
+    """
+    return frozenset(sys.intern(exp) for exp in expansions_ptrn.findall(tmpl))
 
 
-_is_digit = re.compile(r"\d+")
+def resolve(exp, context: config.Context, lower_layer: config.Layer) -> Optional[Any]:
+    """Finds the value for a single expansion name, or None."""
+    # isdecimal rather than isdigit, which also accepts characters like
+    # superscripts that int() can't parse.
+    if exp.isdecimal():
+        return context.glob(exp)
+    resp = lower_layer.get_item(exp, context, config.NullLayer)
+    if not resp.is_found:
+        return None
+    return resp.value
 
 
 def expand(tmpl, expansions, context: config.Context, lower_layer: config.Layer) -> Optional[AnyStr]:
-    replacements = []
-    for exp in expansions:
-        if _is_digit.match(exp):
-            if not context.globs:
-                return None
-            if exp not in context.globs:
-                return None
-            replacements.append(('{%s}' % exp, context.globs[exp]))
-        else:
-            resp = lower_layer.get_item(exp, context, config.NullLayer)
-            if not resp.is_found:
-                return None
-            replacements.append(('{%s}' % exp, resp.value))
-    t = tmpl
-    for exp, v in replacements:
-        t = t.replace(exp, v)
-    return t
+    """Expands tmpl through its compiled plan.
+
+    expansions is deprecated and ignored, since the plan works out the names
+    from tmpl itself. It is still accepted so existing callers keep working.
+    """
+    return expandable(tmpl).expand(context, lower_layer)
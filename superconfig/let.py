@@ -6,6 +6,8 @@ keys.
 
 """
 
+import functools
+
 from superconfig import config
 from superconfig import helpers
 from superconfig import gtrs
@@ -15,24 +17,19 @@ def compile(x):
     if isinstance(x, int):
         return gtrs.constant(x)
     if isinstance(x, str):
-        expansions = helpers.expansions(x)
-        if not expansions:
-            return gtrs.constant(x)
-
-        # noinspection PyShadowingNames
-        def f(context, lower_layer, x=x, expansions=expansions):
-            return helpers.expand(x, expansions, context, lower_layer)
-        return f
+        return _compile_str(x)
     elif isinstance(x, Key):
-        expansions = helpers.expansions(x.key)
-        if not expansions:
+        tmpl = helpers.expandable(x.key)
+        if tmpl.is_constant:
             return gtrs.config_value_constant_key(x.key)
 
         # noinspection PyShadowingNames
-        def f(context, lower_layer, key=x.key, expansions=expansions):
-            target_key = helpers.expand(key, expansions, context, lower_layer)
-            resp = lower_layer.get_item(target_key, context, config.NullConfig)
-            if not resp.found:
+        def f(context, lower_layer, expand=tmpl.expand):
+            target_key = expand(context, lower_layer)
+            if target_key is None:
+                raise KeyError()
+            resp = lower_layer.get_item(target_key, context, config.NullLayer)
+            if not resp.is_found:
                 raise KeyError()
             return resp.value
         return f
@@ -44,6 +41,19 @@ def compile(x):
         return gtrs.constant(x)
 
 
+@functools.lru_cache(maxsize=256)
+def _compile_str(x):
+    """Compiles a string var. Vars are stateless, so one per string is shared."""
+    # Most strings, filenames especially, have nothing to expand. They
+    # become constants without running the expansion pattern over them.
+    if "{" not in x:
+        return gtrs.constant(x)
+    tmpl = helpers.expandable(x)
+    if tmpl.is_constant:
+        return gtrs.constant(x)
+    return tmpl.expand
+
+
 class Key:
     def __init__(self, key):
         self.key = key
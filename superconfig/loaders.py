@@ -1,4 +1,5 @@
 import contextlib
+import math
 import os
 import subprocess
 import time
@@ -11,14 +12,21 @@ from superconfig import gtrs
 
 
 class AtomicRef:
+    """A reference readers can load without taking a lock.
+
+    Rebinding an attribute is atomic, so a reader sees either the old value
+    or the new one, never a mix.
+    """
+    __slots__ = ("value",)
+
     def __init__(self, x):
-        self.value = {"": x}
+        self.value = x
 
     def get(self):
-        return self.value[""]
+        return self.value
 
     def set(self, x):
-        self.value[""] = x
+        self.value = x
 
 
 class AutoRefreshGetter:
@@ -33,8 +41,26 @@ class AutoRefreshGetter:
     It can be configured to either use stale data or dump all data
     in response to clear_on_fetch_failure or clear_on_load_failure.
 
+    If max_refresh_interval_s is set then the refresh interval adapts.
+    Every refresh that finds unchanged data doubles the interval, up to
+    max_refresh_interval_s, and any change drops it back to
+    refresh_interval_s.
+
     If data is dumped, then all calls with return as not found.
 
+    A refresh_interval_s of 0 turns refreshing off. The source is loaded
+    once and later reads go straight to the loaded layer without checking
+    the clock or the source again. pin() does the same for a getter whose
+    source is known never to change.
+
+    Only one load runs at a time. Readers that arrive while it is in flight
+    get the current layer, or wait for the load if nothing has been loaded
+    yet, rather than starting fetches of their own.
+
+    With background_refresh, refreshes after the first successful load
+    run on a shared worker pool. Readers keep getting the current layer
+    while the refresh is in flight instead of waiting on the fetch.
+
     """
     def __init__(
             self,
@@ -45,7 +71,9 @@ class AutoRefreshGetter:
             clear_on_removal=True,
             clear_on_fetch_failure=False,
             clear_on_load_failure=False,
-            is_enabled=None
+            is_enabled=None,
+            max_refresh_interval_s=None,
+            background_refresh=False,
     ):
         self.load_lock = threading.Lock()
         self.layer_constructor = layer_constructor
@@ -59,38 +87,96 @@ class AutoRefreshGetter:
         self.clear_on_fetch_failure = clear_on_fetch_failure
         self.clear_on_load_failure = clear_on_load_failure
         self.is_enabled = is_enabled or gtrs.constant(True)
+        self.max_refresh_interval_s = max_refresh_interval_s
+        self.current_refresh_interval_s = None
+        self.last_data = None
+        self.background_refresh = background_refresh
+        self.pending_refresh = None
+        self.pinned = False
 
     def read(self, key, rest, context, lower_layer):
-        now = time.time()
+        return self.current_layer(key, rest, context, lower_layer).get_item(".".join(rest), context, lower_layer)
+
+    def current_layer(self, key, rest, context, lower_layer):
+        """Returns the loaded layer, first refreshing it if a refresh is due.
+
+        Callers that already hold the joined key can look it up in the layer
+        themselves rather than having read() join rest back together.
+        """
+        if self.next_load_s == math.inf:
+            return self.loaded_layer.value
+        now = time.monotonic()
         if self.next_load_s >= now:
-            return self.loaded_layer.get().get_item(".".join(rest), context, lower_layer)
+            return self.loaded_layer.value
         if self.load_lock.acquire(blocking=False):
-            try:
-                if self.is_enabled(context, lower_layer):
-                    with self.fetcher.load(now, key, rest, context, lower_layer) as bin_data:
-                        if bin_data is not None:
-                            self.loaded_layer.set(self.layer_constructor(bin_data))
-                    self.last_successful_load = now
-                    self.next_load_s += now + self.refresh_interval_s(context, lower_layer)
-            except exceptions.DataSourceMissing:
-                if self.clear_on_removal:
-                    self.loaded_layer.set(config.NullLayer)
-                self.next_load_s = now + self.retry_interval_s(context, lower_layer)
-            except exceptions.FetchFailure:
-                if self.clear_on_fetch_failure:
-                    self.loaded_layer.set(config.NullLayer)
-                self.next_load_s += now + self.retry_interval_s(context, lower_layer)
-            except exceptions.LoadFailure:
-                if self.clear_on_load_failure:
-                    self.loaded_layer.set(config.NullLayer)
-                self.next_load_s += now + self.retry_interval_s(context, lower_layer)
-            except Exception as e:
-                if self.clear_on_fetch_failure:
-                    self.loaded_layer.set(config.NullLayer)
-                self.next_load_s += now + self.retry_interval_s(context, lower_layer)
-            finally:
-                self.load_lock.release()
-        return self.loaded_layer.get().get_item(".".join(rest), context, lower_layer)
+            if self.background_refresh and self.last_successful_load:
+                try:
+                    self.pending_refresh = gtrs.refresh_pool().submit(
+                        self.load, now, key, rest, context.snapshot(), lower_layer)
+                except Exception:
+                    self.load_lock.release()
+                    raise
+            else:
+                self.load(now, key, rest, context, lower_layer)
+        elif not self.last_successful_load:
+            # Nothing has been loaded yet, so rather than answering from an
+            # empty layer wait for the load in flight and share its result.
+            with self.load_lock:
+                pass
+        return self.loaded_layer.value
+
+    def load(self, now, key, rest, context, lower_layer):
+        """Refreshes the loaded layer. The caller must hold load_lock."""
+        try:
+            if self.is_enabled(context, lower_layer):
+                with self.fetcher.load(now, key, rest, context, lower_layer) as bin_data:
+                    if bin_data is not None:
+                        self.loaded_layer.set(self.layer_constructor(bin_data))
+                self.last_successful_load = now
+                refresh_interval_s = self.next_refresh_interval_s(bin_data, context, lower_layer)
+                if refresh_interval_s and not self.pinned:
+                    self.next_load_s = now + refresh_interval_s
+                else:
+                    self.next_load_s = math.inf
+        except exceptions.DataSourceMissing:
+            if self.clear_on_removal:
+                self.loaded_layer.set(config.NullLayer)
+            self.next_load_s = now + self.retry_interval_s(context, lower_layer)
+        except exceptions.FetchFailure:
+            if self.clear_on_fetch_failure:
+                self.loaded_layer.set(config.NullLayer)
+            self.next_load_s = now + self.retry_interval_s(context, lower_layer)
+        except exceptions.LoadFailure:
+            if self.clear_on_load_failure:
+                self.loaded_layer.set(config.NullLayer)
+            self.next_load_s = now + self.retry_interval_s(context, lower_layer)
+        except Exception as e:
+            if self.clear_on_fetch_failure:
+                self.loaded_layer.set(config.NullLayer)
+            self.next_load_s = now + self.retry_interval_s(context, lower_layer)
+        finally:
+            self.load_lock.release()
+
+    def pin(self):
+        """Stops refreshing once the source has been loaded successfully."""
+        self.pinned = True
+        if self.last_successful_load:
+            self.next_load_s = math.inf
+
+    def next_refresh_interval_s(self, bin_data, context, lower_layer):
+        refresh_interval_s = self.refresh_interval_s(context, lower_layer)
+        if self.max_refresh_interval_s is None:
+            return refresh_interval_s
+        changed = bin_data is not None and bin_data != self.last_data
+        if bin_data is not None:
+            self.last_data = bin_data
+        if changed or self.current_refresh_interval_s is None:
+            self.current_refresh_interval_s = refresh_interval_s
+        else:
+            self.current_refresh_interval_s = min(
+                self.max_refresh_interval_s(context, lower_layer),
+                self.current_refresh_interval_s * 2)
+        return self.current_refresh_interval_s
 
     @staticmethod
     def always_enabled(key, rest, context, lower_layer):
@@ -108,21 +194,14 @@ class FileFetcher(AbstractFetcher):
     def __init__(self, filename_value, reader=None):
         self.name = filename_value
         self.filename = None
-        self.last_mtime = 0
+        self.last_stat_key = None
         if reader is None:
             self.reader = simple_reader
         else:
             self.reader = reader
 
-    def load_required(self, filename):
-        # The expansion works because there is an implicit sequencing between
-        # these two calls.
-        if not self.last_mtime:
-            return True
-        try:
-            return os.stat(filename).st_mtime > self.last_mtime
-        except FileNotFoundError:
-            raise exceptions.DataSourceMissing()
+    def load_required(self, s):
+        return self.last_stat_key is None or stat_key(s) != self.last_stat_key
 
     @contextlib.contextmanager
     def load(self, now, key, rest, context, lower_layer):
@@ -133,16 +212,16 @@ class FileFetcher(AbstractFetcher):
         # Not sure if this belongs here or after load_required() call.
         self.filename = filename
 
-        if not self.load_required(filename):
-            yield None
-            return
-
         try:
-            # Get stat before, so if the file is updated after the stat, then it will
-            # be found as out-of-date on the next load.
+            # One stat decides whether to read, and because it is taken before
+            # the read, a file updated after it is found out-of-date on the
+            # next load.
             s = os.stat(filename)
+            if not self.load_required(s):
+                yield None
+                return
             yield self.reader(filename)
-            self.last_mtime = s.st_mtime
+            self.last_stat_key = stat_key(s)
         except FileNotFoundError:
             raise exceptions.DataSourceMissing()
         except IOError:
@@ -151,9 +230,21 @@ class FileFetcher(AbstractFetcher):
             raise
 
 
+def stat_key(s):
+    """What a file's stat must match for its contents to be taken as unchanged.
+
+    Comparing mtime alone misses rewrites within the filesystem's timestamp
+    resolution, so the size and inode (which changes when a file is replaced
+    by a rename) are compared as well.
+    """
+    return s.st_mtime_ns, s.st_size, s.st_ino
+
+
 def simple_reader(filename):
-    with open(filename, 'rb') as f:
-        return f.read()
+    # Unbuffered, so readall() sizes one read from fstat and fills it directly
+    # rather than copying through BufferedReader's buffer.
+    with open(filename, 'rb', buffering=0) as f:
+        return f.readall()
 
 
 def sops_reader(filename, sops_args):
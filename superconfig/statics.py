@@ -6,22 +6,40 @@ from typing import Tuple
 from typing import Optional
 from typing import Any
 
-import jproperties
-
 from superconfig.exceptions import LoadFailure
 from superconfig import config
 
 
 class ObjLayer(config.Layer):
+    """Serves the leaves of a nested dict/list object.
+
+    The object is flattened into a dict of dotted keys when the layer is
+    built, so a lookup is a single dict probe regardless of depth. The
+    dict holds ready-made responses, so lookups don't allocate, and its keys
+    are interned like the keys Config looks up, so probes match on identity.
+
+    List indexes are flattened in their canonical spelling. Other spellings
+    that int() accepts, like "-1" or "01", miss the dict and are resolved by
+    walking the object, as they always have been.
+    """
     def __init__(self, data):
         self.data = data
+        self.flat = {config.intern_key(k): config.Response.found(v) for k, v in self.flatten(data)}
+        self.holds_lists = self.has_list(data)
 
     def get_item(self, key: AnyStr, context: config.Context, lower_layer) -> config.Response:
         """Gets the value for key or (Found, Go, None) if not found on terminal node."""
-        indexes = key.split('.')
+        resp = self.flat.get(key)
+        if resp is not None:
+            return resp
+        if self.holds_lists and type(key) is str:
+            return self.walk(key)
+        return config.Response.not_found
+
+    def walk(self, key):
+        """Looks key up by walking the object a segment at a time."""
         v = self.data
-        for i in range(0, len(indexes)):
-            index = indexes[i]
+        for index in config.split_key(key):
             if isinstance(v, dict):
                 try:
                     v = v[index]
@@ -39,27 +57,77 @@ class ObjLayer(config.Layer):
             return config.Response.not_found
         return config.Response.found(v)
 
+    def flat_items(self):
+        """Every key this layer finds, paired with its value."""
+        return ((k, resp.value) for k, resp in self.flat.items())
+
+    def key_prefixes(self):
+        """The first segments of the keys this layer finds, or None for a top-level list."""
+        if not isinstance(self.data, dict):
+            return None
+        return {k for k in self.data if isinstance(k, str)}
+
+    @staticmethod
+    def flatten(data):
+        """Yields (dotted_key, leaf) for every leaf in data."""
+        stack = [("", data)]
+        while stack:
+            prefix, v = stack.pop()
+            if isinstance(v, dict):
+                # Keys containing dots can't be addressed, so they are left out.
+                stack.extend((prefix + k + ".", x) for k, x in v.items() if isinstance(k, str) and "." not in k)
+            elif isinstance(v, list):
+                stack.extend((prefix + str(i) + ".", x) for i, x in enumerate(v))
+            elif prefix:
+                yield prefix[:-1], v
+
+    @staticmethod
+    def has_list(data):
+        """True if a list appears anywhere in data."""
+        stack = [data]
+        while stack:
+            v = stack.pop()
+            if isinstance(v, list):
+                return True
+            if isinstance(v, dict):
+                stack.extend(v.values())
+        return False
+
     @classmethod
     def from_bytes(cls, x, encoding="utf8"):
         return cls(json.loads(x.decode(encoding)))
 
 
 class InnerObjLayer(config.Layer):
+    """Serves every node of a nested dict, inner dicts included.
+
+    Like ObjLayer, the paths are indexed once when the layer is built, so a
+    lookup is a single dict probe rather than a walk down the object.
+    """
     def __init__(self, data):
         self.data = data
+        self.flat = {config.intern_key(k): config.Response.found(v) for k, v in self.flatten(data)}
 
     def get_item(self, key: AnyStr, context: config.Context, lower_layer) -> config.Response:
         """Gets the value for key or (Found, Go, None) if not found on terminal node."""
-        indexes = key.split('.')
-        v = self.data
-        for i in range(0, len(indexes)):
-            if not isinstance(v, dict):
-                return config.Response.not_found
-            index = indexes[i]
-            if index not in v:
-                return config.Response.not_found
-            v = v[index]
-        return config.Response.found(v)
+        return self.flat.get(key, config.Response.not_found)
+
+    def key_prefixes(self):
+        """The first segments of the keys this layer finds."""
+        if not isinstance(self.data, dict):
+            return ()
+        return {k for k in self.data if isinstance(k, str)}
+
+    @staticmethod
+    def flatten(data):
+        """Yields (dotted_key, node) for every node reachable through dicts."""
+        stack = [("", data)]
+        while stack:
+            prefix, v = stack.pop()
+            if prefix:
+                yield prefix[:-1], v
+            if isinstance(v, dict):
+                stack.extend((prefix + k + ".", x) for k, x in v.items() if isinstance(k, str) and "." not in k)
 
     @classmethod
     def from_file(cls, f):
@@ -95,11 +163,13 @@ class IniLayer(config.Layer):
 
 
 class PropertiesLayer(config.Layer):
-    def __init__(self, properties: jproperties.Properties):
+    def __init__(self, properties: "jproperties.Properties"):
         self.properties = properties
 
     @classmethod
     def from_string(cls, x):
+        # jproperties is imported on first use, like the YAML and TOML parsers.
+        import jproperties
         p = jproperties.Properties(x)
         try:
             p.load(x)
@@ -1,6 +1,9 @@
 import base64
+import datetime
 
 import boto3
+import botocore.exceptions
+import freezegun
 import moto
 import pytest
 
@@ -173,6 +176,113 @@ def test_secmgr_load_from_name_template_fails():
         _ = c["a.b"]
 
 
+@moto.mock_secretsmanager
+def test_fetchers_share_default_client():
+    assert aws.SecretsManagerFetcher().client is aws.SecretsManagerFetcher().client
+    assert aws.AwsParameterStoreFetcher().client is aws.default_client("ssm")
+
+
+@moto.mock_ssm
+def test_default_client_follows_default_session():
+    boto3.setup_default_session(region_name="eu-west-1")
+    try:
+        client = aws.default_client("ssm")
+        assert client.meta.region_name == "eu-west-1"
+        assert aws.default_client("ssm") is client
+        boto3.setup_default_session(region_name="us-west-2")
+        assert aws.default_client("ssm").meta.region_name == "us-west-2"
+    finally:
+        boto3.DEFAULT_SESSION = None
+
+
+class FakeSecretCache:
+    def __init__(self, strings, binaries):
+        self.strings = strings
+        self.binaries = binaries
+        self.calls = []
+
+    def get_secret_string(self, secret_id, version_stage):
+        self.calls.append((secret_id, version_stage))
+        return self.strings.get(secret_id)
+
+    def get_secret_binary(self, secret_id, version_stage):
+        return self.binaries[secret_id]
+
+
+def test_secmgr_reads_through_secret_cache():
+    cache = FakeSecretCache({"a.b": "foo"}, {"c.d": b"bar"})
+    c = config.Config(config.Context(), gtrs.GetterLayer({
+        k: loaders.AutoRefreshGetter(
+            layer_constructor=config.ConstantLayer,
+            fetcher=aws.SecretsManagerFetcher(client=object(), secret_cache=cache),
+        )
+        for k in ["a.b", "c.d"]
+    }))
+    assert c["a.b"] == b"foo"
+    assert c["c.d"] == b"bar"
+    assert cache.calls == [("a.b", "AWSCURRENT"), ("c.d", "AWSCURRENT")]
+
+
+class BatchingSecretsClient:
+    def __init__(self, secrets):
+        self.secrets = secrets
+        self.batches = []
+        self.singles = []
+
+    def batch_get_secret_value(self, SecretIdList):
+        self.batches.append(SecretIdList)
+        return {
+            'SecretValues': [
+                {'Name': n, 'ARN': 'arn:' + n, 'SecretString': self.secrets[n]}
+                for n in SecretIdList if n in self.secrets and n != 'flaky'
+            ],
+            'Errors': [{'SecretId': n} for n in SecretIdList if n not in self.secrets or n == 'flaky'],
+        }
+
+    def get_secret_value(self, SecretId, VersionStage=None):
+        self.singles.append(SecretId)
+        if SecretId not in self.secrets:
+            raise KeyError(SecretId)
+        return {'SecretString': self.secrets[SecretId]}
+
+
+def test_secmgr_fetch_many_batches_by_twenty():
+    secrets = {"s%d" % i: "v%d" % i for i in range(25)}
+    client = BatchingSecretsClient(secrets)
+    values = aws.SecretsManagerFetcher(client=client).fetch_many(sorted(secrets))
+    assert values == {k: v.encode('utf8') for k, v in secrets.items()}
+    assert [len(b) for b in client.batches] == [20, 5]
+    assert client.singles == []
+
+
+def test_secmgr_fetch_many_retries_failures_individually():
+    client = BatchingSecretsClient({"a": "1", "flaky": "2"})
+    values = aws.SecretsManagerFetcher(client=client).fetch_many(["a", "flaky", "missing"])
+    assert values == {"a": b"1", "flaky": b"2"}
+    assert sorted(client.singles) == ["flaky", "missing"]
+
+
+def test_secmgr_fetch_many_leaves_out_malformed_secrets():
+    class MalformedSecretsClient(BatchingSecretsClient):
+        def batch_get_secret_value(self, SecretIdList):
+            self.batches.append(SecretIdList)
+            return {'SecretValues': [{'Name': 'a', 'SecretString': '1'}, {'Name': 'empty'}]}
+
+    client = MalformedSecretsClient({})
+    values = aws.SecretsManagerFetcher(client=client).fetch_many(["a", "empty"])
+    assert values == {"a": b"1"}
+    assert client.singles == []
+
+
+def test_secmgr_fetch_many_with_stage_fetches_each():
+    secrets = {"s%d" % i: "v%d" % i for i in range(10)}
+    client = BatchingSecretsClient(secrets)
+    values = aws.SecretsManagerFetcher(client=client).fetch_many(sorted(secrets), stage="AWSCURRENT")
+    assert values == {k: v.encode('utf8') for k, v in secrets.items()}
+    assert client.batches == []
+    assert sorted(client.singles) == sorted(secrets)
+
+
 @moto.mock_ssm
 def test_parameterstore_implicit_tree_root():
     ps = boto3.client("ssm")
@@ -197,6 +307,103 @@ def test_parameterstore_explicit_tree_root():
     assert c["a.b"] == "foo"
 
 
+@moto.mock_ssm
+def test_parameterstore_tree_root_with_trailing_slash():
+    ps = boto3.client("ssm")
+    ps.put_parameter(Name="/c/b/d", Type="String", Value="foo")
+    c = config.Config(config.Context(), gtrs.GetterLayer({"a": builders.aws_parameter_store_getter("/c/")}))
+    assert c["a.b.d"] == "foo"
+
+
+class CountingClient:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        self.calls.append(name)
+        return getattr(self.client, name)
+
+
+@moto.mock_ssm
+def test_parameterstore_lists_values_with_tree():
+    ps = boto3.client("ssm")
+    for i in range(12):
+        ps.put_parameter(Name="/a/p%d" % i, Type="String", Value=str(i))
+    client = CountingClient(ps)
+    c = config.Config(config.Context(), gtrs.GetterLayer({
+        "a": loaders.AutoRefreshGetter(
+            layer_constructor=gtrs.IndexGetterLayer,
+            fetcher=aws.AwsParameterStoreFetcher(root="/a", client=client))}))
+    assert [c["a.p%d" % i] for i in range(12)] == [str(i) for i in range(12)]
+    assert client.calls == ["get_paginator"]
+
+
+@moto.mock_ssm
+def test_parameterstore_prefetch_serves_listed_values():
+    ps = boto3.client("ssm")
+    ps.put_parameter(Name="/a/p", Type="String", Value="1")
+    client = CountingClient(ps)
+    c = config.Config(config.Context(), gtrs.GetterLayer({
+        "a": loaders.AutoRefreshGetter(
+            layer_constructor=gtrs.IndexGetterLayer,
+            fetcher=aws.AwsParameterStoreFetcher(root="/a", client=client, prefetch=True))}))
+    assert c["a.p"] == "1"
+    ps.put_parameter(Name="/a/p", Type="String", Value="2", Overwrite=True)
+    assert c["a.p"] == "1"
+    assert client.calls == ["get_paginator"]
+
+
+class FailingParameterClient:
+    def __init__(self, code):
+        self.code = code
+
+    def get_parameter(self, Name, WithDecryption):
+        raise botocore.exceptions.ClientError({"Error": {"Code": self.code}}, "GetParameter")
+
+
+def test_parameter_node_read_failures():
+    p = {"Name": "/a/b", "Type": "String", "Value": "foo"}
+    ctx = config.Context()
+    for code, expected in [("ThrottlingException", config.Response.found_next("foo")),
+                           ("ParameterNotFound", config.Response.not_found_next)]:
+        node = aws.ParameterNode(FailingParameterClient(code), p, None)
+        assert node.read("a.b", (), ctx, config.NullLayer) == expected
+
+
+def test_parameter_node_treats_unexpected_errors_as_missing():
+    class BrokenClient:
+        def get_parameter(self, Name, WithDecryption):
+            raise RuntimeError("broken")
+
+    node = aws.ParameterNode(BrokenClient(), {"Name": "/a/b", "Type": "String", "Value": "foo"}, None)
+    assert node.read("a.b", (), config.Context(), config.NullLayer) == config.Response.not_found_next
+
+
+def test_parameter_node_does_not_echo_secure_values(capsys):
+    p = {"Name": "/a/b", "Type": "SecureString", "Value": "hunter2"}
+    node = aws.ParameterNode(None, p, lambda x: x, p)
+    assert node.read("a.b", (), config.Context(), config.NullLayer).value == "hunter2"
+    assert capsys.readouterr() == ("", "")
+
+
+def test_parameter_node_reuses_value_within_ttl():
+    class Client:
+        calls = 0
+
+        def get_parameter(self, Name, WithDecryption):
+            Client.calls += 1
+            return {"Parameter": {"Name": Name, "Type": "String", "Value": str(Client.calls)}}
+
+    p = {"Name": "/a/b", "Type": "String", "Value": "0"}
+    node = aws.ParameterNode(Client(), p, None, p, ttl_s=30)
+    ctx = config.Context()
+    now = datetime.datetime.now()
+    for t, expected in [(0, "0"), (10, "0"), (31, "1"), (40, "1"), (62, "2")]:
+        with freezegun.freeze_time(now + datetime.timedelta(seconds=t)):
+            assert node.read("a.b", (), ctx, config.NullLayer).value == expected
+
+
 @moto.mock_ssm
 def test_parameter_store_value_handling():
     ps = boto3.client("ssm")
@@ -242,3 +449,16 @@ def test_parameterstore_path_expansion():
         ]
     )
     assert c["a.c"] == "foo"
+
+
+def test_config_switch():
+    ctx = config.Context()
+    lower = statics.ObjLayer({"switch": {"on": 1, "off": 0}})
+    for enable_key, default, expected in [
+        ("switch.on", False, True),
+        ("switch.off", True, False),
+        ("switch.missing", True, True),
+        (True, False, True),
+        (False, True, False),
+    ]:
+        assert aws.config_switch(enable_key, default)("k", (), ctx, lower) is expected
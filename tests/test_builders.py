@@ -117,6 +117,19 @@ def test_value_pulls_from_all_the_way_below():
     assert c["a.b"] == "1"
 
 
+def test_value_default_compares_by_identity():
+    class NoCompare:
+        def __eq__(self, other):
+            raise TypeError()
+        __ne__ = __eq__
+    default = NoCompare()
+    c = builders.config_stack({"a.b": builders.value(default=default), "c": builders.value(default=None)})
+    assert c["a.b"] is default
+    assert c["c"] is None
+    with pytest.raises(ValueError):
+        builders.value(default=None, stop=True)
+
+
 def test_performs_transform():
     c = builders.config_stack(
         gtrs.GetterLayer({"a.b": builders.value(transform=int)}),
@@ -287,6 +300,22 @@ def test_autoload_format_by_extension(tmp_path):
         assert c[key] == expected_value
 
 
+def test_autoload_format_by_content(tmp_path):
+    test_cases = [
+        ('{"a": {"b": 1}}\n', "foo", "a.b", 1),
+        ('a:\n  b: 1\n', "foo.conf", "a.b", 1),
+        ('[a]\nb = 1\n', "foo.cfg", "a.b", "1"),
+        ('a.b = one\n', "foo", "a.b", "one"),
+    ]
+    for contents, filename, key, expected_value in test_cases:
+        f = tmp_path / filename
+        f.write_text(contents)
+        c = builders.config_stack(
+            builders.file_layer(filename=f)
+        )
+        assert c[key] == expected_value
+
+
 @moto.mock_secretsmanager
 def test_aws_secretsmanager_getter():
     sm = boto3.client("secretsmanager")
@@ -1,3 +1,8 @@
+import collections
+import datetime
+import threading
+
+import freezegun
 import pytest
 
 from .helpers import is_expected_getitem
@@ -11,6 +16,12 @@ from superconfig.statics import InnerObjLayer
 from superconfig.statics import IniLayer
 from superconfig.config import Context
 from superconfig.config import ConstantLayer
+from superconfig.config import Layer
+from superconfig.config import layer_stack
+from superconfig.config import NullLayer
+from superconfig.config import Response
+from superconfig.config import intern_key
+from superconfig.config import split_key
 
 
 def test_getitem():
@@ -27,6 +38,9 @@ def test_getitem():
         ({"a": [0, 1, 2, 3]}, "a.2", 2),
         ({"a": [0, 1, {"b": 2}, 3]}, "a.2.b", 2),
         ([0, 1, 2, 3], "6", KeyError),
+        ({"a": None}, "a", None),
+        ({"a": {}, "b": []}, "a", KeyError),
+        ({"a": {}, "b": []}, "b", KeyError),
     ]
     for (d, k, res) in test_cases:
         config = Config(Context(), ObjLayer(d))
@@ -76,6 +90,94 @@ def test_layering_getitem():
         assert is_expected_getitem(config, k, res)
 
 
+def test_layer_cake_pop_removes_top_layer():
+    layer_cake = LayerCake()
+    bottom = ObjLayer({"a": 1})
+    top = ObjLayer({"a": 2})
+    layer_cake.push(bottom)
+    layer_cake.push(top)
+    config = Config(Context(), layer_cake)
+    assert config["a"] == 2
+    assert layer_cake.pop() is top
+    assert config["a"] == 1
+    assert layer_cake.pop() is bottom
+    with pytest.raises(IndexError):
+        layer_cake.pop()
+
+
+def test_layer_cake_stops_at_constant_layer():
+    class Unreachable(Layer):
+        def get_item(self, key, context, lower_layer):
+            raise AssertionError("layer below a constant was visited")
+
+    layer_cake = layer_stack([ObjLayer({"a": 1}), ConstantLayer(2), Unreachable()])
+    config = Config(Context(), layer_cake)
+    assert config["a"] == 1
+    assert config["b"] == 2
+
+
+def test_layer_cake_skips_layers_by_key_prefix():
+    class OwnsA(Layer):
+        calls = 0
+
+        def get_item(self, key, context, lower_layer):
+            OwnsA.calls += 1
+            return lower_layer.get_item(key, context, NullLayer)
+
+        def key_prefixes(self):
+            return ["a.b"]
+
+    layer_cake = layer_stack([OwnsA(), ObjLayer({"a": {"b": 1}}), ObjLayer({"c": 2})])
+    config = Config(Context(), layer_cake)
+    assert config["c"] == 2
+    assert OwnsA.calls == 0
+    assert config["a.b"] == 1
+    assert OwnsA.calls == 1
+    with pytest.raises(KeyError):
+        _ = config["e"]
+
+
+def test_config_cache():
+    class Counting(Layer):
+        calls = 0
+
+        def get_item(self, key, context, lower_layer):
+            Counting.calls += 1
+            return Response.found(Counting.calls) if key != "missing" else Response.not_found
+
+    config = Config(Context(), Counting(), cache_size=2, ttl_s=10)
+    now = datetime.datetime.now()
+    with freezegun.freeze_time(now):
+        assert [config["a"], config["a"], config.get("b"), config["a"]] == [1, 1, 2, 1]
+        assert config.get("missing") is None
+        assert config.get("missing") is None
+        assert config["c"] == 5
+        assert config["b"] == 6
+        config.invalidate("c")
+        assert config["c"] == 7
+    with freezegun.freeze_time(now + datetime.timedelta(seconds=11)):
+        assert config["c"] == 8
+
+
+def test_config_cache_is_safe_across_threads():
+    config = Config(Context(), ObjLayer({"0": 0, "1": 1}), cache_size=1)
+
+    class EvictingCache(collections.OrderedDict):
+        """Has another reader evict the key being read right after it's found."""
+        def get(self, key, default=None):
+            resp = super().get(key, default)
+            if key == "0":
+                other = threading.Thread(target=lambda: config.get("1"))
+                other.start()
+                other.join(0.1)
+            return resp
+
+    assert config.get("0") == 0
+    config.cache = EvictingCache(config.cache)
+    assert config.get("0") == 0
+    assert config.get("0") == 0
+
+
 def test_layered_config():
     test_cases = [
         ([], "a", KeyError),
@@ -89,6 +191,31 @@ def test_layered_config():
         assert is_expected_getitem(config, k, res)
 
 
+def test_layers_see_only_layers_below():
+    class Below(ConstantLayer):
+        def get_item(self, key, context, lower_layer):
+            resp = lower_layer.get_item(key, context, NullLayer)
+            return resp.new_value(("below", resp.value)) if resp.is_found else resp
+    config = layered_config(Context(), [Below(None), ObjLayer({"a": 1}), Below(None), ObjLayer({"b": 2})])
+    assert config["a"] == ("below", 1)
+    assert config["b"] == ("below", ("below", 2))
+    assert [type(x) for x in config.layer] == [Below, ObjLayer, Below, ObjLayer]
+
+
+def test_misses_return_shared_responses():
+    ctx = Context()
+    cake = layer_stack([ObjLayer({"a": 1}), InnerObjLayer({"b": 2})])
+    for layer in [NullLayer, ObjLayer({"a": 1}), InnerObjLayer({"a": 1}), cake]:
+        assert layer.get_item("z", ctx, NullLayer) is Response.not_found
+
+
+def test_response_expiry():
+    for expire, now, expired in [(None, 5, True), (4, 5, True), (5, 5, True), (6, 5, False)]:
+        resp = Response.found(1, expire)
+        assert resp.has_expired(now) is expired
+        assert resp.still_unexpired(now) is not expired
+
+
 def test_inner_obj_layer():
     test_cases = [
         ({}, "a", KeyError),
@@ -99,6 +226,10 @@ def test_inner_obj_layer():
         ({"a": {"b": 2}}, "a", {"b": 2}),
         ({"a": {"b": 2}}, "a.b", 2),
         ({"a": {"b": [1, 2]}}, "a.b", [1, 2]),
+        ({"a": {"b": [1, 2]}}, "a.b.0", KeyError),
+        ({"a": {"": 3}}, "a.", 3),
+        ({"a.b": 1}, "a.b", KeyError),
+        ([1], "0", KeyError),
     ]
     for (d, k, res) in test_cases:
         config = Config(Context(), InnerObjLayer(d))
@@ -112,6 +243,12 @@ def test_constant_layer():
     assert is_expected_getitem(config, "a.b", 1)
 
 
+def test_static_layers_reuse_responses():
+    ctx = Context()
+    for layer, key in [(ConstantLayer(1), "a"), (ObjLayer({"a": {"b": 1}}), "a.b")]:
+        assert layer.get_item(key, ctx, NullLayer) is layer.get_item(key, ctx, NullLayer)
+
+
 def test_ini_layer():
     test_cases = [
         ("""# An INI file
@@ -142,3 +279,103 @@ b:2
         PropertiesLayer.from_string(config)
     )
     assert c["a"] == "1"
+
+
+def test_freeze_merges_static_layers():
+    config = layered_config(Context(), [
+        ObjLayer({"a": 1, "b": {"c": [2, 3]}, "d.e": 4}),
+        ObjLayer({"a": 5, "f": 6}),
+    ]).freeze()
+    assert {k: resp.value for k, resp in config.flat.items()} == {"a": 1, "b.c.0": 2, "b.c.1": 3, "f": 6}
+    assert config["b.c.1"] == 3
+    assert is_expected_getitem(config, "d.e", KeyError)
+
+
+def test_freeze_follows_pushes_and_pops():
+    cake = layer_stack([ObjLayer({"a": 1, "b": 2})])
+    config = Config(Context(), cake).freeze()
+    assert config["a"] == 1
+    cake.push(ObjLayer({"a": 3}))
+    assert config["a"] == 3
+    cake.pop()
+    cake.pop()
+    with pytest.raises(KeyError):
+        _ = config["b"]
+
+
+def test_freeze_stops_at_dynamic_layer():
+    config = layered_config(Context(), [
+        ObjLayer({"a": 1}),
+        ConstantLayer(2),
+        ObjLayer({"b": 3}),
+    ]).freeze()
+    assert {k: resp.value for k, resp in config.flat.items()} == {"a": 1}
+    assert config["a"] == 1
+    assert config["b"] == 2
+
+
+def test_context_globs():
+    ctx = Context()
+    assert ctx.glob("1") is None
+    with ctx.and_globs(("x", "y")):
+        assert ctx.glob("1") == "x"
+        assert ctx.glob("2") == "y"
+        assert ctx.glob("3") is None
+        assert ctx.glob("0") is None
+        assert ctx.glob("1a") is None
+        assert ctx.globs == {"1": "x", "2": "y"}
+    assert ctx.globs == {}
+
+
+def test_context_globs_are_per_thread():
+    ctx = Context()
+    seen = []
+    with ctx.and_globs(("x",)):
+        t = threading.Thread(target=lambda: seen.append(ctx.glob("1")))
+        t.start()
+        t.join()
+        assert ctx.snapshot().glob("1") == "x"
+    assert seen == [None]
+
+
+def test_context_globs_are_per_context():
+    outer, inner = Context(("base",)), Context()
+    with outer.and_globs(("x",)):
+        with inner.and_globs(("y",)):
+            assert (outer.glob("1"), inner.glob("1")) == ("x", "y")
+        assert inner.glob("1") is None
+    assert outer.glob("1") == "base"
+
+
+def test_intern_key():
+    key = "".join(["a.", "b"])
+    assert intern_key(key) is intern_key("a.b")
+    assert intern_key(1) == 1
+
+
+def test_split_key():
+    assert split_key("a.b.c") == ("a", "b", "c")
+    assert split_key("a.b.c") is split_key("a.b.c")
+    assert split_key("") == ("",)
+    assert split_key("d") == ("d",)
+
+
+def test_obj_layer_interns_flat_keys():
+    layer = ObjLayer({"a": {"b": 1}})
+    assert next(iter(layer.flat)) is intern_key("".join(["a.", "b"]))
+
+
+def test_obj_layer_resolves_list_indexes_spelled_like_ints():
+    layer = ObjLayer({"a": [1, 2], "b": {"c": 3}})
+    for key, expected in [("a.1", 2), ("a.-1", 2), ("a.00", 1)]:
+        assert layer.get_item(key, Context(), NullLayer) == Response.found(expected)
+    for key in ["a.2", "a.x", "b.-1", "a"]:
+        assert layer.get_item(key, Context(), NullLayer) is Response.not_found
+
+
+def test_obj_layers_list_top_level_key_prefixes():
+    assert ObjLayer({"a": {"b": [1, 2]}, "c": 3}).key_prefixes() == {"a", "c"}
+    assert InnerObjLayer({"a": {"b": 1}}).key_prefixes() == {"a"}
+    assert ObjLayer([1, 2]).key_prefixes() is None
+    config = Config(Context(), layer_stack([ObjLayer([1, 2]), ObjLayer({"a": {"b": [3]}})]))
+    assert [config["0"], config["-1"], config["a.b.0"]] == [1, 2, 3]
@@ -14,6 +14,10 @@ def test_load_config_from_json_string():
     assert is_expected_getitem(c, "a.b", 1)
 
 
+def test_load_obj_from_json_bytes():
+    assert converters.obj_from_json(b"""{"a":{"b": 1}}""") == {"a": {"b": 1}}
+
+
 def test_load_obj_from_json_string_with_error():
     cfg = ":-b\nc:\n"
     with pytest.raises(exceptions.LoadFailure):
@@ -39,6 +43,21 @@ a:
     assert converters.obj_from_yaml(cfg) == {"a": {"b": 1}}
 
 
+def test_load_obj_from_yaml_bytes():
+    cfg = b"""# A YAML test file
+a:
+  b: 1
+
+"""
+    assert converters.obj_from_yaml(cfg) == {"a": {"b": 1}}
+
+
+def test_load_obj_from_yaml_rejects_python_tags():
+    cfg = "a: !!python/object/apply:os.getcwd []\n"
+    with pytest.raises(exceptions.LoadFailure):
+        converters.obj_from_yaml(cfg)
+
+
 def test_load_obj_from_yaml_string_with_error():
     cfg = ":-b\nc:\n"
     with pytest.raises(exceptions.LoadFailure):
@@ -68,3 +87,47 @@ b=1
 """
     with pytest.raises(exceptions.LoadFailure):
         converters.obj_from_toml(cfg)
+
+
+def test_malformed_documents_fail_to_load():
+    deep = 5000
+    test_cases = [
+        (converters.obj_from_json, b'{"a": }'),
+        (converters.obj_from_yaml, b"a: [1\n"),
+        (converters.obj_from_toml, "a = 1\na = 2\n"),
+        (converters.obj_from_toml, "a = " + "[" * deep + "]" * deep),
+    ]
+    for convert, cfg in test_cases:
+        with pytest.raises(exceptions.LoadFailure):
+            convert(cfg)
+
+
+def test_bytes_from_base64():
+    assert converters.bytes_from_base64(b"Zm9v") == b"foo"
+
+
+def test_bytes_from_base64_with_error():
+    with pytest.raises(exceptions.LoadFailure):
+        converters.bytes_from_base64(b"Zm9v!")
+
+
+def test_pipeline():
+    p = converters.pipeline(converters.bytes_from_base64, converters.string_from_bytes, converters.obj_from_json)
+    assert p(b"eyJhIjogMX0=") == {"a": 1}
+    for bad in [b"Zm9v!", b"/w==", b"e30x"]:
+        with pytest.raises(exceptions.LoadFailure):
+            p(bad)
+
+
+def test_pipeline_lets_bugs_propagate():
+    def broken(x):
+        return x.no_such_attribute
+
+    with pytest.raises(AttributeError):
+        converters.pipeline(converters.string_from_bytes, broken)(b"a")
+
+
+def test_string_from_bytes_with_error():
+    for x, encoding in [(b"\xff", "utf8"), (b"a", "no-such-encoding")]:
+        with pytest.raises(exceptions.LoadFailure):
+            converters.string_from_bytes(x, encoding=encoding)
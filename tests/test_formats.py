@@ -1,3 +1,5 @@
+import pytest
+
 from superconfig import formats
 
 
@@ -7,3 +9,48 @@ def test_expected_types_defined():
     _ = formats.Format.Properties
     _ = formats.Format.Toml
     _ = formats.Format.Yaml
+
+
+def test_layer_constructor_for_filename():
+    for filename, format in [("a.json", formats.Format.Json), ("b/c.yml", formats.Format.Yaml)]:
+        assert formats.layer_constructor_for_filename(filename) is formats.layer_constructor_for_format(format)
+    with pytest.raises(KeyError):
+        formats.layer_constructor_for_filename("a.txt")
+
+
+def test_identical_bytes_share_layer():
+    constructor = formats.layer_constructor_for_format(formats.Format.Json)
+    assert constructor(b'{"a": 1}') is constructor(b'{"a": 1}')
+
+
+def test_parse_cache_is_bounded_and_keyed_on_digests():
+    cache = formats.memoized(len, maxsize=2)
+    for data in [b"a", b"bb", b"ccc"]:
+        assert cache(data) == len(data)
+    assert len(cache.layers) == 2
+    assert all(len(digest) == 16 for digest in cache.layers)
+
+
+def test_invalidate_parse_cache():
+    constructor = formats.layer_constructor_for_format(formats.Format.Json)
+    layer = constructor(b'{"a": 1}')
+    formats.invalidate_parse_cache()
+    assert constructor(b'{"a": 1}') is not layer
+
+
+def test_detect_format():
+    test_cases = [
+        (b'  {"a": 1}', formats.Format.Json),
+        (b'[1, 2]', formats.Format.Json),
+        (b'---\na: 1\n', formats.Format.Yaml),
+        (b'# comment\na:\n  b: 1\n', formats.Format.Yaml),
+        (b'; comment\n[a]\nb = 1\n', formats.Format.Ini),
+        (b'! comment\na.b=1\n', formats.Format.Properties),
+        (b'a.b=http://example.com\nc=1\n', formats.Format.Properties),
+        (b'a = 1\n', None),
+        (b'# plain TOML\na = 1\nb = "x"\nc = [1, 2]\n\n[d]\ne = true\n', None),
+        (b'', None),
+        (b'just some text', None),
+    ]
+    for data, expected in test_cases:
+        assert formats.detect_format(data) == expected
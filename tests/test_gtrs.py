@@ -1,5 +1,8 @@
+import collections
 import datetime
 import json
+import threading
+import time
 
 import freezegun
 import pytest
@@ -70,6 +73,23 @@ def test_env_getter_with_envar(monkeypatch):
     assert c["a.b"] == "foo"
 
 
+def test_env_getter_reads_snapshot(monkeypatch):
+    s = gtrs.GetterLayer()
+    s["a.b"] = gtrs.Env("AB")
+    c = config.Config(config.Context(), s)
+    monkeypatch.setenv("AB", "foo")
+    gtrs.snapshot_env()
+    try:
+        monkeypatch.setenv("AB", "bar")
+        assert c["a.b"] == "foo"
+        gtrs.snapshot_env()
+        assert c["a.b"] == "bar"
+    finally:
+        gtrs.live_env()
+    monkeypatch.setenv("AB", "baz")
+    assert c["a.b"] == "baz"
+
+
 def test_getter_stack_empty_is_not_found():
     s = gtrs.GetterLayer()
     s["a.b"] = gtrs.GetterStack([])
@@ -146,8 +166,10 @@ def test_transform_failure():
         raise Oops
     s["a.b"] = gtrs.Transform(f=oops, getter=gtrs.Constant(5))
     c = config.Config(config.Context(), s)
-    with pytest.raises(ValueError):
+    with pytest.raises(ValueError, match="for key a.b") as e:
         _ = c["a.b"]
+    assert isinstance(e.value.__cause__.exception, Oops)
+    assert str(e.value.__cause__) == "could not transform value 5 for key a.b: "
     with pytest.raises(ValueError):
         _ = c.get("a.b")
 
@@ -205,6 +227,26 @@ def test_expansion_layer():
         assert is_expected_getitem(c, k, res)
 
 
+def test_expansion_getter_passes_through_not_found():
+    c = config.Config(config.Context(), gtrs.GetterLayer({"a": gtrs.ExpansionGetter(gtrs.NotFound())}))
+    with pytest.raises(KeyError):
+        _ = c["a"]
+
+
+def test_key_var_raises_on_missing_key():
+    lower = statics.ObjLayer({"a": "b", "x": "y"})
+    assert let.compile(let.Key("a"))(config.Context(), lower) == "b"
+    assert let.compile(let.Key("{a}"))(config.Context(), statics.ObjLayer({"a": "x", "x": "y"})) == "y"
+    for k in ["missing", "{a}", "{missing}.x"]:
+        with pytest.raises(KeyError):
+            let.compile(let.Key(k))(config.Context(), lower)
+
+
+def test_string_vars_are_shared():
+    assert let.compile("/etc/{env}.json") is let.compile("/etc/{env}.json")
+    assert let.compile("/etc/{env}.json")(config.Context(), statics.ObjLayer({"env": "prod"})) == "/etc/prod.json"
+
+
 def test_graft():
     c = config.layered_config(config.Context(), [
             gtrs.GetterLayer({
@@ -271,6 +313,92 @@ def test_cache_records_have_distinct_expirations():
                 assert c[key] == expected_value
 
 
+def test_cache_getter_evicts_least_recently_used():
+    counter = gtrs.Counter(0)
+    c = config.Config(config.Context(), gtrs.GetterLayer({
+        "{}": gtrs.CacheGetter(counter, ttl_s=gtrs.constant(60), max_entries=2),
+    }))
+    with freezegun.freeze_time():
+        assert c["a"] == 1
+        assert c["b"] == 2
+        assert c["a"] == 1
+        assert c["c"] == 3
+        assert c["a"] == 1
+        assert c["b"] == 4
+
+
+def test_cache_getter_lru_is_safe_across_threads():
+    g = gtrs.CacheGetter(gtrs.Constant(1), ttl_s=gtrs.constant(60), max_entries=1)
+    c = config.Config(config.Context(), gtrs.GetterLayer({"{}": g}))
+
+    class EvictingCache(collections.OrderedDict):
+        """Has another reader evict the key being read right after it's found."""
+        def get(self, key, default=None):
+            resp = super().get(key, default)
+            if key == "a":
+                other = threading.Thread(target=lambda: c["b"])
+                other.start()
+                other.join(0.1)
+            return resp
+
+    with freezegun.freeze_time():
+        assert c["a"] == 1
+        g.cache = EvictingCache(g.cache)
+        assert c["a"] == 1
+
+
+def test_cache_getter_serves_stale_value_while_refreshing():
+    release = threading.Event()
+
+    class SlowCounter(gtrs.Getter):
+        def __init__(self):
+            self.n = 0
+
+        def read(self, key, rest, context, lower_layer):
+            if self.n:
+                release.wait()
+            self.n += 1
+            return config.Response.found(self.n)
+
+    g = gtrs.CacheGetter(SlowCounter(), ttl_s=gtrs.constant(60), soft_ttl_s=gtrs.constant(10))
+    c = config.Config(config.Context(), gtrs.GetterLayer({"a": g}))
+    now = datetime.datetime.now()
+    with freezegun.freeze_time(now):
+        assert c["a"] == 1
+    with freezegun.freeze_time(now + datetime.timedelta(seconds=11)):
+        assert c["a"] == 1
+        assert c["a"] == 1
+        release.set()
+        while g.refreshing:
+            time.sleep(0.01)
+        assert c["a"] == 2
+    assert g.getter.n == 2
+
+
+def test_cache_getter_logs_failed_background_refresh(caplog):
+    class FailsAfterFirst(gtrs.Getter):
+        def __init__(self):
+            self.n = 0
+
+        def read(self, key, rest, context, lower_layer):
+            self.n += 1
+            if self.n > 1:
+                raise RuntimeError("source down")
+            return config.Response.found(self.n)
+
+    g = gtrs.CacheGetter(FailsAfterFirst(), ttl_s=gtrs.constant(60), soft_ttl_s=gtrs.constant(10))
+    c = config.Config(config.Context(), gtrs.GetterLayer({"a": g}))
+    now = datetime.datetime.now()
+    with freezegun.freeze_time(now):
+        assert c["a"] == 1
+    with freezegun.freeze_time(now + datetime.timedelta(seconds=11)):
+        assert c["a"] == 1
+        while g.refreshing:
+            time.sleep(0.01)
+        assert c["a"] == 1
+    assert "background refresh of a failed" in caplog.text
+
+
 def test_key_expansion_layer():
     s = gtrs.GetterLayer()
     s["a.b"] = gtrs.Constant(5)
@@ -326,24 +454,46 @@ def test_smart_layer_root_getter(tmp_path):
     assert c["b.c"] == 2
 
 
+def test_frozen_getter_layer_lists_key_prefixes():
+    s = gtrs.GetterLayer({"a.b": gtrs.Constant(1)})
+    assert s.key_prefixes() is None
+    s.freeze()
+    assert list(s.key_prefixes()) == ["a"]
+    with pytest.raises(TypeError):
+        s["c"] = gtrs.Constant(2)
+    assert gtrs.GetterLayer({"{}.b": gtrs.Constant(1)}).freeze().key_prefixes() is None
+    c = config.layered_config(config.Context(), [s, statics.ObjLayer({"a": {"c": 2}, "d": 3})])
+    assert c["a.b"] == 1
+    assert c["a.c"] == 2
+    assert c["d"] == 3
+
+
 def test_matched_pattern_getters():
     class FoundKey:
         def read(self, key, rest, *args, **kwargs):
             return config.Response.found((key, rest))
     test_cases = [
-        ({"one": FoundKey()}, "one", ("one", [])),
-        ({"one": FoundKey()}, "one.two", ("one", ["two"])),
-        ({"{}": FoundKey()}, "one", ("one", [])),
-        ({"{}": FoundKey()}, "one.two", ("one", ["two"])),
-        ({"{}.{}": FoundKey()}, "one.two", ("one.two", [])),
-        ({"{}.{}": FoundKey()}, "one.two.three", ("one.two", ["three"])),
-        ({"one.{}": FoundKey()}, "one.two.three", ("one.two", ["three"])),
-        ({"{}.two": FoundKey()}, "one.two.three", ("one.two", ["three"])),
+        ({"one": FoundKey()}, "one", ("one", ())),
+        ({"one": FoundKey()}, "one.two", ("one", ("two",))),
+        ({"{}": FoundKey()}, "one", ("one", ())),
+        ({"{}": FoundKey()}, "one.two", ("one", ("two",))),
+        ({"{}.{}": FoundKey()}, "one.two", ("one.two", ())),
+        ({"{}.{}": FoundKey()}, "one.two.three", ("one.two", ("three",))),
+        ({"one.{}": FoundKey()}, "one.two.three", ("one.two", ("three",))),
+        ({"{}.two": FoundKey()}, "one.two.three", ("one.two", ("three",))),
         ({"{}.two": FoundKey()}, "one", KeyError),
+        ({"one.two": FoundKey(), "{}.{}.three": FoundKey()}, "four.five.three", ("four.five.three", ())),
+        ({"one.two": FoundKey(), "one.{}": FoundKey()}, "one.six", ("one.six", ())),
         ({"{}": builders.value(default="{1}", expand_result=True)}, "one.two", "one"),
         ({"{}.{}": builders.value(default="{2}.{1}", expand_result=True)}, "one.two", "two.one"),
         ({"{}.{}": builders.value(default="{1}.{2}", expand_result=True)}, "one.two.three", "one.two"),
         ({"{}.{}": builders.value(default="{1}.{2}", expand_result=True)}, "one", KeyError),
+        ({"x{}.{}": builders.value(default="{2}.{1}", expand_result=True)}, "xone.two", "two.one"),
+        ({"x{}.{}": FoundKey()}, "one.two", KeyError),
+        ({"{}.two": FoundKey(), "one.{}": builders.value(default="{1}", expand_result=True)}, "one.two", ("one.two", ())),
+        ({"one.{}": builders.value(default="{1}", expand_result=True), "{}.two": FoundKey()}, "one.two", "two"),
+        ({"{}": FoundKey()}, ".a", KeyError),
+        ({"a.b": FoundKey()}, "a", KeyError),
     ]
     for getters, key, expected_value in test_cases:
         c = config.layered_config(
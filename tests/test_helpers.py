@@ -0,0 +1,72 @@
+import sys
+
+from superconfig import config
+from superconfig import helpers
+from superconfig import statics
+
+
+def test_expandable_string():
+    lower = statics.ObjLayer({"a": "x", "b": {"c": "y"}, "1x": "z", "\u00b2": "w"})
+    test_cases = [
+        ("plain", "plain"),
+        ("{a}", "x"),
+        ("{a}.{b.c}-{a}", "x.y-x"),
+        ("{a}{b.c}{a}", "xyx"),
+        ("{a}.{missing}", None),
+        ("{1x}", "z"),
+        ("{\u00b2}", "w"),
+    ]
+    for tmpl, expected in test_cases:
+        assert helpers.ExpandableString(tmpl).expand(config.Context(), lower) == expected
+
+
+def test_expandable_string_uses_globs():
+    ctx = config.Context()
+    with ctx.and_globs(("x",)):
+        assert helpers.ExpandableString("{1}.{2}").expand(ctx, config.NullLayer) is None
+    with ctx.and_globs(("x", "y")):
+        assert helpers.ExpandableString("{2}.{1}").expand(ctx, config.NullLayer) == "y.x"
+
+
+def test_expandable_is_cached():
+    assert helpers.expandable("{a}.b") is helpers.expandable("{a}.b")
+
+
+def test_constant_template_skips_lookups():
+    class Unreachable(config.Layer):
+        def get_item(self, key, context, lower_layer):
+            raise AssertionError("looked up %s" % key)
+    assert helpers.ExpandableString("/a/b").expand(config.Context(), Unreachable()) == "/a/b"
+
+
+def test_expand_looks_each_name_up_once():
+    lookups = []
+
+    class Recording(config.Layer):
+        def get_item(self, key, context, lower_layer):
+            lookups.append(key)
+            return config.Response.found(key.upper())
+    tmpl = "{a}/{b}/{a}"
+    assert helpers.expand(tmpl, helpers.expansions(tmpl), config.Context(), Recording()) == "A/B/A"
+    assert sorted(lookups) == ["a", "b"]
+
+
+def test_expand_does_not_reexpand_values():
+    lower = statics.ObjLayer({"a": "{b}", "b": "x"})
+    tmpl = "{a}-{b}"
+    assert helpers.expand(tmpl, helpers.expansions(tmpl), config.Context(), lower) == "{b}-x"
+
+
+def test_expandable_string_drops_empty_literals():
+    tmpl = helpers.ExpandableString("{a}{b}/c")
+    assert tmpl.pieces == (None, None, "/c")
+    assert tmpl.slots == ((0, "a"), (1, "b"))
+
+
+def test_expansion_names_are_interned():
+    interned = sys.intern("region")
+    name = "".join(["reg", "ion"])
+    assert name is not interned
+    (exp,) = helpers.expansions("{%s}.x" % name)
+    assert exp is interned
+    assert all(n is interned for n in helpers.ExpandableString("{%s}/{%s}" % (name, name)).names)
@@ -1,5 +1,8 @@
+import contextlib
 import datetime
 import json
+import os
+import threading
 
 import freezegun
 import pytest
@@ -71,6 +74,31 @@ def test_file_layer_loader_does_not_load_unchanged_files(tmp_path):
         assert not loaded[0]
 
 
+def test_file_layer_loader_does_not_reparse_touched_files(tmp_path):
+    loaded = [0]
+
+    def load_counting_loader(f):
+        loaded[0] += 1
+        return statics.ObjLayer.from_bytes(f)
+
+    check_period_s = 3
+    now = datetime.datetime.now()
+    f = tmp_path / "foo.json"
+    f.write_text(json.dumps({"a": 1}))
+    c = config.layered_config(config.Context(), [
+        builders.FileLayerLoader(
+            layer_constructor=load_counting_loader,
+            filename=let.compile(str(f)),
+            refresh_interval_s=let.compile(check_period_s),
+        )])
+    with freezegun.freeze_time(now):
+        assert c["a"] == 1
+        f.write_text(json.dumps({"a": 1}))
+    with freezegun.freeze_time(now + datetime.timedelta(seconds=check_period_s+1)):
+        assert c["a"] == 1
+    assert loaded[0] == 1
+
+
 def test_file_layer_loader_loads_changed_files_after_cache_period(tmp_path):
     check_period_s = 3
     now = datetime.datetime.now()
@@ -89,6 +117,44 @@ def test_file_layer_loader_loads_changed_files_after_cache_period(tmp_path):
         assert c["a"] == 2
 
 
+def test_file_layer_loader_with_zero_interval_loads_once(tmp_path, monkeypatch):
+    now = datetime.datetime.now()
+    f = tmp_path / "foo.json"
+    f.write_text(json.dumps({"a": 1}))
+    c = config.layered_config(config.Context(), [
+        builders.FileLayerLoader(
+            layer_constructor=statics.ObjLayer.from_bytes,
+            filename=let.compile(str(f)),
+            refresh_interval_s=let.compile(0),
+        )])
+    with freezegun.freeze_time(now):
+        assert c["a"] == 1
+        f.write_text(json.dumps({"a": 2}))
+    monkeypatch.setattr(loaders.os, "stat", None)
+    with freezegun.freeze_time(now + datetime.timedelta(days=1)):
+        assert c["a"] == 1
+
+
+def test_file_layer_loader_loads_rewrites_with_the_same_mtime(tmp_path):
+    check_period_s = 3
+    now = datetime.datetime.now()
+    f = tmp_path / "foo.json"
+    f.write_text(json.dumps({"a": 1}))
+    mtime_ns = f.stat().st_mtime_ns
+    c = config.layered_config(config.Context(), [
+        builders.FileLayerLoader(
+            layer_constructor=statics.ObjLayer.from_bytes,
+            filename=let.compile(str(f)),
+            refresh_interval_s=let.compile(check_period_s),
+        )])
+    with freezegun.freeze_time(now):
+        assert c["a"] == 1
+        f.write_text(json.dumps({"a": 22}))
+        os.utime(f, ns=(mtime_ns, mtime_ns))
+    with freezegun.freeze_time(now + datetime.timedelta(seconds=check_period_s+1)):
+        assert c["a"] == 22
+
+
 def test_file_layer_loader_w_clear_clears_config_after_file_removed(tmp_path):
     check_period_s = 3
     now = datetime.datetime.now()
@@ -211,3 +277,136 @@ def test_autoload_filename_expansion_fails(tmp_path):
     with pytest.raises(KeyError):
         _ = c["a"]
 
+
+
+def test_refresh_interval_backs_off_while_unchanged():
+    g = loaders.AutoRefreshGetter(
+        layer_constructor=statics.ObjLayer.from_bytes,
+        fetcher=None,
+        refresh_interval_s=gtrs.constant(10),
+        max_refresh_interval_s=gtrs.constant(35),
+    )
+    ctx = config.Context()
+    assert g.next_refresh_interval_s(b"a", ctx, config.NullLayer) == 10
+    assert g.next_refresh_interval_s(None, ctx, config.NullLayer) == 20
+    assert g.next_refresh_interval_s(b"a", ctx, config.NullLayer) == 35
+    assert g.next_refresh_interval_s(b"a", ctx, config.NullLayer) == 35
+    assert g.next_refresh_interval_s(b"b", ctx, config.NullLayer) == 10
+
+
+def test_refresh_interval_fixed_by_default():
+    g = loaders.AutoRefreshGetter(
+        layer_constructor=statics.ObjLayer.from_bytes,
+        fetcher=None,
+        refresh_interval_s=gtrs.constant(10),
+    )
+    ctx = config.Context()
+    assert g.next_refresh_interval_s(b"a", ctx, config.NullLayer) == 10
+    assert g.next_refresh_interval_s(None, ctx, config.NullLayer) == 10
+
+
+def test_background_refresh_serves_current_layer_while_loading():
+    release = threading.Event()
+
+    class CountingFetcher(loaders.AbstractFetcher):
+        def __init__(self):
+            self.n = 0
+
+        @contextlib.contextmanager
+        def load(self, now, key, rest, context, lower_layer):
+            self.n += 1
+            if self.n > 1:
+                release.wait()
+            yield str(self.n)
+
+    refresh_interval_s = 3
+    now = datetime.datetime.now()
+    g = loaders.AutoRefreshGetter(
+        layer_constructor=config.ConstantLayer,
+        fetcher=CountingFetcher(),
+        refresh_interval_s=gtrs.constant(refresh_interval_s),
+        background_refresh=True,
+    )
+    c = config.Config(config.Context(), gtrs.GetterLayer({"a": g}))
+    with freezegun.freeze_time(now):
+        assert c["a"] == "1"
+    with freezegun.freeze_time(now + datetime.timedelta(seconds=refresh_interval_s+1)):
+        assert c["a"] == "1"
+        release.set()
+        g.pending_refresh.result()
+        assert c["a"] == "2"
+
+
+def test_concurrent_first_reads_share_one_load():
+    started = threading.Event()
+    release = threading.Event()
+
+    class SlowFetcher(loaders.AbstractFetcher):
+        def __init__(self):
+            self.n = 0
+
+        @contextlib.contextmanager
+        def load(self, now, key, rest, context, lower_layer):
+            self.n += 1
+            started.set()
+            release.wait()
+            yield str(self.n)
+
+    fetcher = SlowFetcher()
+    c = config.Config(config.Context(), gtrs.GetterLayer({
+        "a": loaders.AutoRefreshGetter(layer_constructor=config.ConstantLayer, fetcher=fetcher)}))
+    results = []
+    readers = [threading.Thread(target=lambda: results.append(c["a"])) for _ in range(4)]
+    readers[0].start()
+    started.wait()
+    for r in readers[1:]:
+        r.start()
+    release.set()
+    for r in readers:
+        r.join()
+    assert results == ["1"] * 4
+    assert fetcher.n == 1
+
+
+def test_pinned_getter_stops_refreshing(tmp_path):
+    refresh_interval_s = 3
+    now = datetime.datetime.now()
+    f = tmp_path / "foo.json"
+    f.write_text(json.dumps({"a": 1}))
+    g = builders.FileLayerLoader(
+        layer_constructor=statics.ObjLayer.from_bytes,
+        filename=let.compile(str(f)),
+        refresh_interval_s=let.compile(refresh_interval_s),
+    )
+    c = config.layered_config(config.Context(), [g])
+    with freezegun.freeze_time(now):
+        assert c["a"] == 1
+        g.auto_loader.pin()
+        f.write_text(json.dumps({"a": 2}))
+    with freezegun.freeze_time(now + datetime.timedelta(seconds=refresh_interval_s+1)):
+        assert c["a"] == 1
+
+
+def test_refresh_deadline_is_set_from_the_latest_load():
+    class CountingFetcher(loaders.AbstractFetcher):
+        def __init__(self):
+            self.n = 0
+
+        @contextlib.contextmanager
+        def load(self, now, key, rest, context, lower_layer):
+            self.n += 1
+            yield str(self.n)
+
+    refresh_interval_s = 3
+    now = datetime.datetime.now()
+    fetcher = CountingFetcher()
+    c = config.Config(config.Context(), gtrs.GetterLayer({"a": loaders.AutoRefreshGetter(
+        layer_constructor=config.ConstantLayer,
+        fetcher=fetcher,
+        refresh_interval_s=gtrs.constant(refresh_interval_s),
+    )}))
+    for i in range(1, 4):
+        with freezegun.freeze_time(now + datetime.timedelta(seconds=(refresh_interval_s+1) * i)):
+            assert c["a"] == str(i)
+            assert c["a"] == str(i)
+    assert fetcher.n == 3